@@ -1,93 +1,111 @@
 import os
 import sys
-import json
+import orjson
+import asyncio
 import random
 import re
 import ast
-import tokenize
 import io
+import tokenize
 import textwrap
-import autopep8
-from tokenize import TokenInfo
+import functools
+import bisect
+import keyword
+import hashlib
+import itertools
+import httpx
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pydantic import BaseModel, ValidationError
-from ollama import chat
+from ollama import AsyncClient
 ###############################################################################
 # Pydantic models for LLM outputs (for prospective mutation data)
 ###############################################################################
 
-class DeadCodeLLM(BaseModel):
+class MutationBundleLLM(BaseModel):
     dead_code_blocks: list[str]
-
-class MisleadingCommentsLLM(BaseModel):
     misleading_comments: list[str]
-
-class MisleadingVarsLLM(BaseModel):
     misleading_variables: list[str]
 
+# The schema never changes, so build it once rather than on every request.
+_BUNDLE_SCHEMA = MutationBundleLLM.model_json_schema()
+
+# Seed recorded in every mutation config; combined with the file name it seeds the
+# per-file random generator, so reruns place mutations identically.
+MUTATION_SEED = "seedlab-vt"
+
 ###############################################################################
 # Functions to fetch mutation snippets from LLM
 ###############################################################################
 
-def fetch_dead_code_blocks(code_text: str, max_inserts: int, llm_model="qwen2.5-coder") -> list[str]:
-    prompt = f"""
-Below is some code:
-{code_text}
+# Optional OpenAI-compatible server (e.g. llama.cpp's llama-server with a quantized GGUF
+# model). When LLM_SERVER_URL is set, requests go there instead of to Ollama.
+LLM_SERVER_URL = os.environ.get("LLM_SERVER_URL")
 
-Using the above code as inspiration, generate {max_inserts} dead code blocks (2-3 lines).
-Return them in a JSON structure with a key "dead_code_blocks" containing a list of strings.
-No extra text, no explanations, just valid JSON.
-"""
-    response = chat(
-        messages=[{"role": "user", "content": prompt}],
-        model=llm_model,
-        format=DeadCodeLLM.model_json_schema()
-    )
-    parsed = DeadCodeLLM.model_validate_json(response.message.content)
-    return parsed.dead_code_blocks
+# How long Ollama keeps the model loaded after a request, so it is not unloaded between files.
+OLLAMA_KEEP_ALIVE = "10m"
 
-def fetch_misleading_comments(code_text: str, max_inserts: int, llm_model="qwen2.5-coder") -> list[str]:
-    prompt = f"""
-Below is some code:
-{code_text}
+@functools.lru_cache(maxsize=1)
+def _clients_for(loop: asyncio.AbstractEventLoop) -> tuple:
+    """
+    Returns the (Ollama, HTTP) clients shared by all requests of an event loop, so their
+    pooled connections are reused instead of reconnecting for every request.
+    """
+    return AsyncClient(), httpx.AsyncClient(timeout=None)
 
-Using the above code as inspiration, generate {max_inserts} misleading single-line comments (like "# ...").
-Return them in a JSON structure with a key "misleading_comments" containing a list of strings.
-No extra text, no explanations, just valid JSON.
-"""
-    response = chat(
-        messages=[{"role": "user", "content": prompt}],
-        model=llm_model,
-        format=MisleadingCommentsLLM.model_json_schema()
-    )
-    parsed = MisleadingCommentsLLM.model_validate_json(response.message.content)
-    return parsed.misleading_comments
+async def chat_json(messages: list, llm_model: str, schema: dict) -> str:
+    """
+    Sends a chat request whose answer is constrained to the JSON schema and returns the
+    response text. Uses the server at LLM_SERVER_URL if set, otherwise Ollama.
+    """
+    ollama_client, http_client = _clients_for(asyncio.get_running_loop())
+    if LLM_SERVER_URL:
+        response = await http_client.post(
+            f"{LLM_SERVER_URL.rstrip('/')}/v1/chat/completions",
+            json={
+                "model": llm_model,
+                "messages": messages,
+                "response_format": {"type": "json_schema", "json_schema": {"name": "response", "schema": schema}},
+                # llama-server: reuse the KV cache of the matching prompt prefix.
+                "cache_prompt": True,
+            },
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)["choices"][0]["message"]["content"]
+    response = await ollama_client.chat(messages=messages, model=llm_model, format=schema, keep_alive=OLLAMA_KEEP_ALIVE)
+    return response.message.content
 
-def fetch_misleading_variables(max_inserts: int, llm_model="qwen2.5-coder") -> list[str]:
+async def fetch_mutation_bundle(code_text: str, max_inserts: int, llm_model="qwen2.5-coder", feedback: str = "") -> MutationBundleLLM:
+    """
+    Requests dead code blocks, misleading comments and misleading variable names in a
+    single structured call, so the code is sent and prefilled once per file.
+    Optional feedback is appended to the instruction (used when retrying).
+    """
     prompt = f"""
-Generate {max_inserts} meaningless or misleading variable names.
-Return them in a JSON structure with a key "misleading_variables" containing a list of strings.
-No extra text, no explanations.
-"""
-    response = chat(
-        messages=[{"role": "user", "content": prompt}],
-        model=llm_model,
-        format=MisleadingVarsLLM.model_json_schema()
+Using the above code as inspiration, generate:
+- {max_inserts} dead code blocks (2-3 lines), under the key "dead_code_blocks";
+- {max_inserts} misleading single-line comments (like "# ..."), under the key "misleading_comments";
+- {max_inserts} meaningless or misleading variable names, under the key "misleading_variables".
+Return them in a JSON structure with these three keys, each containing a list of strings.
+No extra text, no explanations, just valid JSON.
+{feedback}"""
+    content = await chat_json(
+        [
+            {"role": "system", "content": f"Below is some code:\n<code>\n{code_text}\n</code>"},
+            {"role": "user", "content": prompt},
+        ],
+        llm_model,
+        _BUNDLE_SCHEMA
     )
-    parsed = MisleadingVarsLLM.model_validate_json(response.message.content)
-    return parsed.misleading_variables
+    return MutationBundleLLM.model_validate_json(content)
 
-def generate_mutation_config(code_text: str, max_inserts: int, llm_model: str) -> dict:
+def build_mutation_config(max_inserts: int, dead_code_list: list, comments_list: list, variables_list: list) -> dict:
     """
-    Uses LLM to generate prospective mutation snippets based on the input code.
-    Returns a dictionary with keys for dead code, misleading comments, and misleading variables.
+    Builds the mutation configuration dictionary from the generated snippet lists.
     """
-    seed_value = "seedlab-vt"
+    seed_value = MUTATION_SEED
     decompose_max_inserts = 1  # Not used in current pipeline
 
-    dead_code_list = fetch_dead_code_blocks(code_text, max_inserts, llm_model)
-    comments_list = fetch_misleading_comments(code_text, max_inserts, llm_model)
-    variables_list = fetch_misleading_variables(max_inserts, llm_model)
-
     result_dict = {
         "configs": {
             "seed": seed_value
@@ -112,84 +130,296 @@ def generate_mutation_config(code_text: str, max_inserts: int, llm_model: str) -
     }
     return result_dict
 
+async def generate_mutation_config(code_text: str, max_inserts: int, llm_model: str) -> dict:
+    """
+    Uses LLM to generate prospective mutation snippets based on the input code.
+    Returns a dictionary with keys for dead code, misleading comments, and misleading variables.
+    """
+    bundle = await fetch_mutation_bundle(code_text, max_inserts, llm_model)
+    return build_mutation_config(max_inserts, bundle.dead_code_blocks, bundle.misleading_comments, bundle.misleading_variables)
+
+###############################################################################
+# Persistent cache of per-file mutation configurations
+###############################################################################
+
+MUTATION_CACHE_DIR = ".mutcfg"
+
+def config_cache_key(code_text: str, max_inserts: int, llm_model: str) -> str:
+    """
+    Fingerprint of a mutation request. Assigned variables are renamed to v0, v1, ... in
+    order of first assignment, so programs that differ only in variable names share a key.
+    """
+    ctx = _build_ctx(code_text)
+    if ctx is not None:
+        code_text = rename_names(ctx.source, {name: f"v{i}" for i, name in enumerate(ctx.store_names)})
+    return hashlib.sha256(f"{llm_model}\n{max_inserts}\n{code_text}".encode("utf-8")).hexdigest()
+
+def load_cached_config(cache_dir: str, key: str):
+    """
+    Returns the mutation configuration cached under key, or None on a miss.
+    """
+    try:
+        with open(os.path.join(cache_dir, f"{key}.json"), "rb") as f:
+            return orjson.loads(f.read())
+    except Exception as e:
+        return None
+
+def store_cached_config(cache_dir: str, key: str, mutation_config: dict) -> None:
+    """
+    Writes a mutation configuration to the cache; the file is replaced atomically.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.json")
+    with open(path + ".tmp", "wb") as f:
+        f.write(orjson.dumps(mutation_config, option=orjson.OPT_INDENT_2))
+    os.replace(path + ".tmp", path)
+
+###############################################################################
+# Shared snippet pool: one LLM call per dataset instead of one per file
+###############################################################################
+
+SNIPPET_POOL_FILE = ".snippet_pool.json"
+SNIPPET_POOL_SIZE = 20      # Snippets of each kind requested for the pool.
+SNIPPET_POOL_SAMPLES = 3    # Dataset programs shown to the LLM as inspiration.
+SNIPPET_POOL_ATTEMPTS = 3   # LLM calls allowed to fill the pool.
+
+def validate_snippets(bundle: MutationBundleLLM) -> dict:
+    """
+    Keeps only usable snippets: dead code blocks that parse, single-line "#" comments,
+    and variable names that are identifiers but not keywords.
+    Returns a dictionary keyed like MutationBundleLLM.
+    """
+    dead_code = []
+    for block in bundle.dead_code_blocks:
+        try:
+            ast.parse(textwrap.dedent(block))
+        except Exception as e:
+            continue
+        dead_code.append(block)
+    comments = [c.strip() for c in bundle.misleading_comments if c.strip().startswith("#") and "\n" not in c.strip()]
+    variables = [v.strip() for v in bundle.misleading_variables if v.strip().isidentifier() and not keyword.iskeyword(v.strip())]
+    return {"dead_code_blocks": dead_code, "misleading_comments": comments, "misleading_variables": variables}
+
+async def bootstrap_snippet_pool(sample_codes: list, max_inserts: int, llm_model: str) -> dict:
+    """
+    Asks the LLM for a pool of snippets inspired by a few sample programs, keeping only
+    valid ones. If a kind has fewer than SNIPPET_POOL_SIZE valid snippets, the LLM is asked
+    again with feedback on what was rejected.
+    Raises RuntimeError if any kind ends up with fewer than max_inserts snippets.
+    """
+    pool = {"dead_code_blocks": [], "misleading_comments": [], "misleading_variables": []}
+    code_text = "\n\n".join(sample_codes)
+    feedback = ""
+    for attempt in range(SNIPPET_POOL_ATTEMPTS):
+        bundle = await fetch_mutation_bundle(code_text, SNIPPET_POOL_SIZE, llm_model, feedback)
+        valid = validate_snippets(bundle)
+        for key, snippets in valid.items():
+            pool[key].extend(s for s in snippets if s not in pool[key])
+        if all(len(snippets) >= SNIPPET_POOL_SIZE for snippets in pool.values()):
+            break
+        feedback = (
+            "Your previous answer contained unusable entries. Dead code blocks must be valid Python, "
+            "comments must be single lines starting with \"#\", and variable names must be valid "
+            "Python identifiers that are not keywords.\n"
+        )
+    short = [key for key, snippets in pool.items() if len(snippets) < max_inserts]
+    if short:
+        raise RuntimeError(f"LLM returned too few valid snippets for: {', '.join(short)}")
+    return pool
+
+async def load_snippet_pool(pool_path: str, sample_codes: list, max_inserts: int, llm_model: str) -> dict:
+    """
+    Loads the snippet pool cached at pool_path if it was generated by the same model and is
+    large enough; otherwise bootstraps a new pool and caches it.
+    """
+    try:
+        with open(pool_path, "rb") as f:
+            cached = orjson.loads(f.read())
+        pool = cached["snippets"]
+        if cached.get("llm_model") == llm_model and all(len(pool[key]) >= max_inserts for key in pool):
+            return pool
+    except Exception as e:
+        pass
+    pool = await bootstrap_snippet_pool(sample_codes, max_inserts, llm_model)
+    with open(pool_path, "wb") as f:
+        f.write(orjson.dumps({"llm_model": llm_model, "snippets": pool}, option=orjson.OPT_INDENT_2))
+    return pool
+
+def synth_mutation_config(max_inserts: int, pool: dict, rng=random) -> dict:
+    """
+    Builds a mutation configuration locally by sampling max_inserts snippets of each kind
+    from the shared pool, using rng (a random.Random; defaults to the random module).
+    """
+    return build_mutation_config(
+        max_inserts,
+        rng.sample(pool["dead_code_blocks"], max_inserts),
+        rng.sample(pool["misleading_comments"], max_inserts),
+        rng.sample(pool["misleading_variables"], max_inserts),
+    )
+
 ###############################################################################
 # Helper Functions for Mutations on Code String
 ###############################################################################
 
-def insert_comments_str(code: str, bug_line: int, num_comments: int, comments_list: list) -> tuple:
+# Python comments and string literals (with optional prefix, single or triple quoted).
+_STRING_OR_COMMENT = (
+    r"#[^\r\n]*"
+    r"|[rRbBuUfF]{0,2}(?:'''(?:\\[\s\S]|[^\\])*?'''|\"\"\"(?:\\[\s\S]|[^\\])*?\"\"\""
+    r"|'(?:\\.|[^\\'\r\n])*'|\"(?:\\.|[^\\\"\r\n])*\")"
+)
+
+@dataclass
+class CodeContext:
     """
-    Inserts misleading comments into the code string at random statement positions.
-    Returns (new_code, new_bug_line) with bug_line adjusted if insertions occur before it.
+    Parse results for a code string, built once per file and shared by the mutation passes.
+    Inserting comments changes neither statements nor variable bindings, so a context
+    can also be reused for the commented variant of its source.
+    """
+    source: str
+    tree: ast.AST
+    stmt_lines: list[int]
+    store_names: list[str]
+
+@functools.lru_cache(maxsize=512)
+def _parsed(code: str):
+    """
+    Parses the code, retrying once after autopep8 on failure. Cached, so the same code
+    string is parsed (and fixed) at most once per run.
+    Returns (parsed_source, tree), or None if the code cannot be parsed.
     """
     try:
-        tree = ast.parse(code)
+        return code, ast.parse(code)
     except Exception as e:
+        # autopep8 (and pycodestyle) is slow to import and rarely needed; load it on first use.
+        import autopep8
         code = autopep8.fix_code(code)
         try:
-            tree = ast.parse(code)
+            return code, ast.parse(code)
         except Exception as e:
-            return code, bug_line
+            return None
+
+# Tokens that never start a logical line.
+_NON_STATEMENT_TOKENS = {tokenize.NL, tokenize.COMMENT, tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER}
+
+def statement_lines(code: str) -> list:
+    """
+    Returns the line numbers on which a logical line (statement) starts, in order.
+    Comments inserted before these lines cannot end up inside a multi-line string or
+    after a backslash continuation. Falls back to all non-blank, non-comment lines if
+    the code cannot be tokenized.
+    """
+    lines = []
+    at_line_start = True
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+            if tok.type == tokenize.NEWLINE:
+                at_line_start = True
+            elif at_line_start and tok.type not in _NON_STATEMENT_TOKENS:
+                lines.append(tok.start[0])
+                at_line_start = False
+    except (tokenize.TokenError, SyntaxError) as e:
+        return [i for i, line in enumerate(code.splitlines(), start=1) if line.strip() and not line.lstrip().startswith("#")]
+    return lines
+
+def _build_ctx(code: str):
+    """
+    Parses the code and collects the statement lines and assigned variable names.
+    Returns a CodeContext whose source is the parsed code, or None if parsing fails.
+    """
+    parsed = _parsed(code)
+    if parsed is None:
+        return None
+    code, tree = parsed
+
+    # ast.walk is breadth-first, so the assigned names are put back in source order to
+    # keep them in order of first assignment.
+    store_nodes = [node for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)]
+    store_nodes.sort(key=lambda node: (node.lineno, node.col_offset))
+    store_names = list(dict.fromkeys(node.id for node in store_nodes))
+    return CodeContext(source=code, tree=tree, stmt_lines=statement_lines(code), store_names=store_names)
+
+def split_lines(code: str) -> list:
+    """
+    Splits the code into lines that keep their line endings; a newline is added to the
+    last line if it has none, so the lines can be joined back with "".join.
+    """
+    lines = code.splitlines(keepends=True)
+    if lines and not lines[-1].endswith(("\n", "\r")):
+        lines[-1] += "\n"
+    return lines
 
-    statement_lines = sorted({node.lineno for node in ast.walk(tree) if hasattr(node, 'lineno')})
+def insert_comments_lines(lines: list, bug_line: int, num_comments: int, comments_list: list, statement_lines: list, rng=random) -> tuple:
+    """
+    Inserts misleading comments before randomly chosen statement lines of a list of lines
+    (as returned by split_lines). The lines are chosen with rng (a random.Random; defaults
+    to the random module).
+    Returns (new_lines, new_bug_line) with bug_line adjusted if insertions occur before it.
+    """
+    statement_lines = list(statement_lines)
     if num_comments > len(comments_list):
         raise ValueError("Requested number of comments exceeds available comments")
     if not statement_lines:
-        return code, bug_line
+        return lines, bug_line
 
-    random.shuffle(statement_lines)
+    rng.shuffle(statement_lines)
     insert_positions = sorted(statement_lines[:num_comments])
-    updated_lines = code.splitlines()
-    new_bug_line = bug_line
+    num_inserts = len(insert_positions)
+    # Single merge pass: each comment goes right before its (original) statement line.
+    updated_lines = []
     comment_index = 0
-    for pos in insert_positions:
-        if comment_index < num_comments:
-            updated_lines.insert(pos - 1, comments_list[comment_index])
+    for line_no, line in enumerate(lines, start=1):
+        while comment_index < num_inserts and insert_positions[comment_index] == line_no:
+            updated_lines.append(comments_list[comment_index] + "\n")
             comment_index += 1
-            if pos <= bug_line:
-                new_bug_line += 1
-    new_code = "\n".join(updated_lines) + "\n"
-    return new_code, new_bug_line
+        updated_lines.append(line)
+    for comment in comments_list[comment_index:num_inserts]:
+        updated_lines.append(comment + "\n")
+    new_bug_line = bug_line + bisect.bisect_right(insert_positions, bug_line)
+    return updated_lines, new_bug_line
+
+def insert_comments_str(code: str, bug_line: int, num_comments: int, comments_list: list, ctx: CodeContext = None, rng=random) -> tuple:
+    """
+    Inserts misleading comments into the code string at random statement positions.
+    If ctx is given it is used instead of parsing the code again.
+    Returns (new_code, new_bug_line) with bug_line adjusted if insertions occur before it.
+    """
+    if ctx is None:
+        ctx = _build_ctx(code)
+        if ctx is None:
+            return code, bug_line
+        code = ctx.source
+
+    new_lines, new_bug_line = insert_comments_lines(split_lines(code), bug_line, num_comments, comments_list, ctx.stmt_lines, rng)
+    return "".join(new_lines), new_bug_line
+
+def rename_names(code: str, rename_map: dict) -> str:
+    """
+    Replaces every bare occurrence of the names in rename_map. Strings and comments are
+    matched first and kept verbatim; a name is not renamed when it is an attribute
+    (preceded by ".") or part of a longer identifier.
+    """
+    if not rename_map:
+        return code
+    pattern = re.compile(
+        f"({_STRING_OR_COMMENT})|(?<![.\\w])({'|'.join(map(re.escape, rename_map))})(?!\\w)"
+    )
+    return pattern.sub(lambda m: m.group(1) or rename_map[m.group(2)], code)
 
-def update_variable_names_str(code: str, bug_line: int, num_vars: int, vars_list: list) -> tuple:
+def update_variable_names_str(code: str, bug_line: int, num_vars: int, vars_list: list, ctx: CodeContext = None) -> tuple:
     """
     Renames variables in the code string by replacing some variable names with new names.
+    If ctx is given its variable names are used instead of parsing the code again.
     Returns (new_code, bug_line) — bug_line remains unchanged.
     """
-    try:
-        tree = ast.parse(code)
-    except Exception as e:
-        code = autopep8.fix_code(code)
-        try:
-            tree = ast.parse(code)
-        except Exception as e:
+    if ctx is None:
+        ctx = _build_ctx(code)
+        if ctx is None:
             return code, bug_line
+        code = ctx.source
 
-    class VariableCollector(ast.NodeVisitor):
-        def __init__(self):
-            self.variables = set()
-        def visit_Name(self, node):
-            if isinstance(node.ctx, ast.Store):
-                self.variables.add(node.id)
-            self.generic_visit(node)
-
-    collector = VariableCollector()
-    collector.visit(tree)
-    old_vars = list(collector.variables)
+    old_vars = ctx.store_names
     rename_map = dict(zip(old_vars[:num_vars], vars_list[:num_vars]))
-
-    tokens = []
-    try:
-        bytes_io = io.BytesIO(code.encode('utf-8'))
-        for tok in tokenize.tokenize(bytes_io.readline):
-            if tok.type == tokenize.NAME and tok.string in rename_map:
-                tok = TokenInfo(tok.type, rename_map[tok.string], tok.start, tok.end, tok.line)
-            tokens.append(tok)
-    except tokenize.TokenError as e:
-        return code, bug_line
-
-    new_code_bytes = tokenize.untokenize(tokens)
-    new_code = new_code_bytes.decode('utf-8') if isinstance(new_code_bytes, bytes) else new_code_bytes
-    return new_code, bug_line
+    return rename_names(code, rename_map), bug_line
 
 def get_base_indent(lines: list, pos: int) -> str:
     """
@@ -197,66 +427,195 @@ def get_base_indent(lines: list, pos: int) -> str:
     """
     if pos < len(lines):
         line = lines[pos]
-        match = re.match(r'^(\s*)', line)
-        if match:
-            return match.group(1)
+        return line[:len(line) - len(line.lstrip())]
     for i in range(pos - 1, -1, -1):
-        if lines[i].strip():
-            match = re.match(r'^(\s*)', lines[i])
-            if match:
-                return match.group(1)
+        line = lines[i]
+        if line.strip():
+            return line[:len(line) - len(line.lstrip())]
     return ""
 
-def indent_snippet(snippet: str, base_indent: str) -> list:
+def prepare_snippets(snippets: list) -> list:
+    """
+    Dedents each snippet once and splits it into its non-blank lines.
+    Returns a list of line lists, ready for indent_snippet.
     """
-    Dedents the snippet and re-indents each line with base_indent.
+    prepared = []
+    for snippet in snippets:
+        prepared.append([line for line in textwrap.dedent(snippet).splitlines() if line.strip() != ""])
+    return prepared
+
+def indent_snippet(snippet_lines: list, base_indent: str) -> list:
+    """
+    Re-indents each line of a prepared snippet (see prepare_snippets) with base_indent.
     Returns a list of lines.
     """
-    dedented = textwrap.dedent(snippet)
-    snippet_lines = dedented.splitlines()
-    return [base_indent + line + "\n" for line in snippet_lines if line.strip() != ""]
+    return [base_indent + line + "\n" for line in snippet_lines]
 
-def insert_dead_code_snippets_str(code: str, bug_line: int, num_dead: int, dead_snippets: list) -> tuple:
+def insert_dead_code_snippets_lines(original_lines: list, bug_line: int, num_dead: int, prepared_snippets: list, rng=random) -> tuple:
     """
-    Inserts dead-code snippets into the code string at random positions.
+    Inserts dead-code snippets at random positions of a list of lines (as returned by
+    split_lines). The snippets must already be prepared with prepare_snippets. Snippets
+    and positions are chosen with rng (a random.Random; defaults to the random module).
     Adjusts bug_line if insertions occur before the original bug line.
-    Returns (new_code, new_bug_line).
+    Returns (new_lines, new_bug_line).
     """
-    original_lines = code.splitlines(keepends=True)
     total_lines = len(original_lines)
-    num_snippets = min(num_dead, len(dead_snippets), total_lines)
+    num_snippets = min(num_dead, len(prepared_snippets), total_lines)
     if num_snippets <= 0:
-        return code, bug_line
+        return original_lines, bug_line
 
-    chosen_snippets = random.sample(dead_snippets, num_snippets)
-    insertion_positions = sorted(random.sample(range(0, total_lines + 1), num_snippets))
+    chosen_snippets = rng.sample(prepared_snippets, num_snippets)
+    insertion_positions = sorted(rng.sample(range(0, total_lines + 1), num_snippets))
     extra_lines_before_bug = 0
-    for pos, snippet in zip(insertion_positions, chosen_snippets):
+    for pos, snippet_lines in zip(insertion_positions, chosen_snippets):
         if pos <= (bug_line - 1):
-            extra_lines_before_bug += len(textwrap.dedent(snippet).splitlines())
+            extra_lines_before_bug += len(snippet_lines)
     new_bug_line = bug_line + extra_lines_before_bug
 
     new_lines = []
     current_index = 0
-    for pos, snippet in sorted(zip(insertion_positions, chosen_snippets), key=lambda tup: tup[0]):
+    for pos, snippet_lines in sorted(zip(insertion_positions, chosen_snippets), key=lambda tup: tup[0]):
         while current_index < pos:
             new_lines.append(original_lines[current_index])
             current_index += 1
         base_indent = get_base_indent(original_lines, pos)
-        snippet_lines = indent_snippet(snippet, base_indent)
-        new_lines.extend(snippet_lines)
+        new_lines.extend(indent_snippet(snippet_lines, base_indent))
     while current_index < total_lines:
         new_lines.append(original_lines[current_index])
         current_index += 1
 
-    new_code = "".join(new_lines)
-    return new_code, new_bug_line
+    return new_lines, new_bug_line
+
+def insert_dead_code_snippets_str(code: str, bug_line: int, num_dead: int, dead_snippets: list, rng=random) -> tuple:
+    """
+    Inserts dead-code snippets into the code string at random positions.
+    Adjusts bug_line if insertions occur before the original bug line.
+    Returns (new_code, new_bug_line).
+    """
+    new_lines, new_bug_line = insert_dead_code_snippets_lines(split_lines(code), bug_line, num_dead, prepare_snippets(dead_snippets), rng)
+    return "".join(new_lines), new_bug_line
 
 ###############################################################################
 # Combined Pipeline: Generate Mutation Config and Apply Mutations
 ###############################################################################
 
-def process_dataset(dataset_folder: str, output_folder: str, max_inserts: int, llm_model: str) -> None:
+def _emit(folder: str, file_name: str, instruction: str, code: str, bug_line: int, total_lines: int) -> bool:
+    """
+    Writes one mutated program to folder/file_name in the dataset's JSON format, with
+    line_no_percent computed from total_lines (the line count of code).
+    Returns False (after reporting the error) if the file cannot be written.
+    """
+    mutated_json = {
+        "instruction": instruction,
+        "buggy_code": code,
+        "line_no": bug_line,
+        "line_no_percent": f"{round((bug_line/total_lines)*100)}%"
+    }
+    try:
+        with open(os.path.join(folder, file_name), "wb") as f:
+            f.write(orjson.dumps(mutated_json, option=orjson.OPT_INDENT_2))
+    except Exception as e:
+        print(f"Error writing {os.path.basename(folder)} file {file_name}: {e}")
+        return False
+    return True
+
+def mutate_file(output_folder: str, file_name: str, instruction: str, buggy_code: str, bug_line: int, mutation_config: dict) -> bool:
+    """
+    Applies the five mutation passes to one buggy program and writes each result to its
+    folder under output_folder. This is pure CPU work, so process_dataset runs it in a
+    process pool; it must stay a top-level function to be picklable.
+    Returns True if all five outputs were written. An unexpected error is reported and
+    returns False, so that one bad file does not abort the whole pool.
+    """
+    try:
+        return _mutate_file(output_folder, file_name, instruction, buggy_code, bug_line, mutation_config)
+    except Exception as e:
+        print(f"Error mutating {file_name}: {e}")
+        return False
+
+def _mutate_file(output_folder: str, file_name: str, instruction: str, buggy_code: str, bug_line: int, mutation_config: dict) -> bool:
+    """
+    Does the work of mutate_file; errors of the individual passes are reported here.
+    """
+    # A generator per file, seeded from the config, keeps the output independent of
+    # processing order and worker assignment.
+    seed_value = mutation_config.get("configs", {}).get("seed", MUTATION_SEED)
+    rng = random.Random(f"{seed_value}:{file_name}")
+
+    mutations = mutation_config.get("mutations", {})
+    misleading_comments_data = mutations.get("misleading_comments", {})
+    misleading_vars_data = mutations.get("misleading_variables", {})
+    dead_code_data = mutations.get("dead_code", {})
+
+    num_comments = misleading_comments_data.get("max_inserts", 0)
+    comments_list = misleading_comments_data.get("comments", [])
+    num_vars = misleading_vars_data.get("max_inserts", 0)
+    vars_list = misleading_vars_data.get("variables", [])
+    num_dead = dead_code_data.get("max_inserts", 0)
+    dead_snippets = prepare_snippets(dead_code_data.get("snippets", []))
+
+    # Parse and split the buggy code once; the mutation passes share the result.
+    ctx = _build_ctx(buggy_code)
+    parsed_code = ctx.source if ctx is not None else buggy_code
+    parsed_lines = split_lines(parsed_code)
+    buggy_lines = parsed_lines if parsed_code == buggy_code else split_lines(buggy_code)
+
+    # Non-cumulative mutations on original buggy code.
+    try:
+        # a. Insert misleading comments on original buggy code.
+        if ctx is not None:
+            commented_lines, new_line_commented = insert_comments_lines(parsed_lines, bug_line, num_comments, comments_list, ctx.stmt_lines, rng)
+        else:
+            commented_lines, new_line_commented = parsed_lines, bug_line
+        commented_code = "".join(commented_lines)
+    except Exception as e:
+        print(f"Error inserting comments in {file_name}: {e}")
+        return False
+    if not _emit(os.path.join(output_folder, "commented"), file_name, instruction, commented_code, new_line_commented, len(commented_lines)):
+        return False
+
+    try:
+        # b. Update variable names on original buggy code.
+        variable_code, new_line_variable = update_variable_names_str(parsed_code, bug_line, num_vars, vars_list, ctx)
+    except Exception as e:
+        print(f"Error updating variable names in {file_name}: {e}")
+        return False
+    # Renaming never changes the number of lines.
+    if not _emit(os.path.join(output_folder, "variable"), file_name, instruction, variable_code, new_line_variable, len(parsed_lines)):
+        return False
+
+    try:
+        # c. Insert dead code snippets on original buggy code.
+        dead_lines, new_line_dead = insert_dead_code_snippets_lines(buggy_lines, bug_line, num_dead, dead_snippets, rng)
+    except Exception as e:
+        print(f"Error inserting dead code in {file_name}: {e}")
+        return False
+    if not _emit(os.path.join(output_folder, "dead_code"), file_name, instruction, "".join(dead_lines), new_line_dead, len(dead_lines)):
+        return False
+
+    # Cumulative mutations: apply variable mutation on commented code, then dead code on that result.
+    try:
+        # d. Update variable names on the commented code.
+        variable_comm_code, new_line_var_comm = update_variable_names_str(commented_code, new_line_commented, num_vars, vars_list, ctx)
+    except Exception as e:
+        print(f"Error updating variable names cumulatively in {file_name}: {e}")
+        return False
+    if not _emit(os.path.join(output_folder, "variable_cumulative"), file_name, instruction, variable_comm_code, new_line_var_comm, len(commented_lines)):
+        return False
+
+    try:
+        # e. Insert dead code snippets on the cumulative variable code.
+        dead_comm_lines, new_line_dead_comm = insert_dead_code_snippets_lines(split_lines(variable_comm_code), new_line_var_comm, num_dead, dead_snippets, rng)
+    except Exception as e:
+        print(f"Error inserting dead code cumulatively in {file_name}: {e}")
+        return False
+    if not _emit(os.path.join(output_folder, "dead_code_cumulative"), file_name, instruction, "".join(dead_comm_lines), new_line_dead_comm, len(dead_comm_lines)):
+        return False
+
+    print(f"Processed {file_name}")
+    return True
+
+def process_dataset(dataset_folder: str, output_folder: str, max_inserts: int, llm_model: str, shared_snippets: bool = False) -> None:
     """
     Processes each JSON file in dataset_folder. Each JSON is expected to contain:
       {
@@ -265,8 +624,13 @@ def process_dataset(dataset_folder: str, output_folder: str, max_inserts: int, l
          "line_no": <line number>,
          "line_no_percent": "..."
       }
+    Configurations are fetched concurrently; at most OLLAMA_NUM_PARALLEL (default 8) files
+    have LLM requests in flight at a time. The mutation passes then run in a process pool.
     For each file, the function:
-      1. Generates mutation configuration via LLM calls.
+      1. Generates mutation configuration via LLM calls. With shared_snippets, the LLM is
+         instead called once for a snippet pool (cached in output_folder) and each file's
+         configuration is sampled from that pool locally. Otherwise, configurations are
+         cached in output_folder/.mutcfg, keyed on the code with variable names normalized.
       2. Applies three mutation phases in two variants:
          a. Non-cumulative mutations applied directly on the original buggy code:
             - Insert misleading comments -> output folder "commented"
@@ -290,171 +654,102 @@ def process_dataset(dataset_folder: str, output_folder: str, max_inserts: int, l
 
     code_files = [f for f in os.listdir(dataset_folder) if f.lower().endswith(".json")]
     total_files = len(code_files)
+    cache_dir = os.path.join(output_folder, MUTATION_CACHE_DIR)
+
+    # Bound the number of files whose LLM requests are in flight at once; match
+    # this to the OLLAMA_NUM_PARALLEL setting of the Ollama server. Ollama reads 0 as
+    # "choose automatically", which would be a semaphore that never admits a request,
+    # so use at least 1.
+    max_parallel = max(1, int(os.environ.get("OLLAMA_NUM_PARALLEL", "8")))
+
+    async def _run() -> list:
+        semaphore = asyncio.Semaphore(max_parallel)
+
+        pool = None
+        if shared_snippets:
+            sample_codes = []
+            for file_name in sorted(code_files)[:SNIPPET_POOL_SAMPLES]:
+                try:
+                    with open(os.path.join(dataset_folder, file_name), "rb") as f:
+                        sample_codes.append(orjson.loads(f.read()).get("buggy_code", "").strip())
+                except Exception as e:
+                    print(f"Error reading {file_name}: {e}")
+            pool_path = os.path.join(output_folder, SNIPPET_POOL_FILE)
+            pool = await load_snippet_pool(pool_path, sample_codes, max_inserts, llm_model)
+
+        # Files with the same fingerprint share one lookup/LLM request, even while in flight.
+        pending = {}
+
+        async def _fetch_config(cache_key: str, code_text: str) -> dict:
+            mutation_config = load_cached_config(cache_dir, cache_key)
+            if mutation_config is None:
+                async with semaphore:
+                    mutation_config = await generate_mutation_config(code_text, max_inserts, llm_model)
+                store_cached_config(cache_dir, cache_key, mutation_config)
+            return mutation_config
+
+        async def _cached_config(code_text: str) -> dict:
+            cache_key = config_cache_key(code_text, max_inserts, llm_model)
+            if cache_key not in pending:
+                pending[cache_key] = asyncio.ensure_future(_fetch_config(cache_key, code_text))
+            return await pending[cache_key]
+
+        async def _one_file(file_name: str) -> tuple | None:
+            file_path = os.path.join(dataset_folder, file_name)
+            try:
+                with open(file_path, "rb") as f:
+                    code_data = orjson.loads(f.read())
+            except Exception as e:
+                print(f"Error reading {file_name}: {e}")
+                return None
+
+            instruction = code_data.get("instruction", "").strip()
+            buggy_code = code_data.get("buggy_code", "").strip()
+            bug_line = code_data.get("line_no")
+            # We will recompute line_no_percent based on the mutated code.
+            if not buggy_code or bug_line is None:
+                print(f"Missing required fields in {file_name}. Skipping.")
+                return None
+
+            # Generate mutation configuration using LLM (without saving intermediate JSON)
+            try:
+                if pool is not None:
+                    mutation_config = synth_mutation_config(max_inserts, pool, random.Random(f"{MUTATION_SEED}:{file_name}:pool"))
+                else:
+                    mutation_config = await _cached_config(buggy_code)
+            except Exception as e:
+                print(f"Error generating mutation config for {file_name}: {e}. Skipping file.")
+                return None
+
+            return (file_name, instruction, buggy_code, bug_line, mutation_config)
+
+        jobs = await asyncio.gather(*[_one_file(f) for f in code_files])
+        return [job for job in jobs if job is not None]
+
+    jobs = asyncio.run(_run())
+
+    # The mutation passes are CPU-bound and independent per file; spread them over all cores.
     processed_count = 0
-
-    for file_name in code_files:
-        file_path = os.path.join(dataset_folder, file_name)
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                code_data = json.load(f)
-        except Exception as e:
-            print(f"Error reading {file_name}: {e}")
-            continue
-
-        instruction = code_data.get("instruction", "").strip()
-        buggy_code = code_data.get("buggy_code", "").strip()
-        bug_line = code_data.get("line_no")
-        # We will recompute line_no_percent based on the mutated code.
-        if not buggy_code or bug_line is None:
-            print(f"Missing required fields in {file_name}. Skipping.")
-            continue
-
-        # Generate mutation configuration using LLM (without saving intermediate JSON)
-        try:
-            mutation_config = generate_mutation_config(buggy_code, max_inserts, llm_model)
-        except Exception as e:
-            print(f"Error generating mutation config for {file_name}: {e}. Skipping file.")
-            continue
-
-        mutations = mutation_config.get("mutations", {})
-        misleading_comments_data = mutations.get("misleading_comments", {})
-        misleading_vars_data = mutations.get("misleading_variables", {})
-        dead_code_data = mutations.get("dead_code", {})
-
-        num_comments = misleading_comments_data.get("max_inserts", 0)
-        comments_list = misleading_comments_data.get("comments", [])
-        num_vars = misleading_vars_data.get("max_inserts", 0)
-        vars_list = misleading_vars_data.get("variables", [])
-        num_dead = dead_code_data.get("max_inserts", 0)
-        dead_snippets = dead_code_data.get("snippets", [])
-
-        # Non-cumulative mutations on original buggy code.
-        try:
-            # a. Insert misleading comments on original buggy code.
-            commented_code, new_line_commented = insert_comments_str(buggy_code, bug_line, num_comments, comments_list)
-            total_lines = len(commented_code.splitlines())
-            updated_percent = f"{round((new_line_commented/total_lines)*100)}%"
-        except Exception as e:
-            print(f"Error inserting comments in {file_name}: {e}")
-            continue
-        commented_json = {
-            "instruction": instruction,
-            "buggy_code": commented_code,
-            "line_no": new_line_commented,
-            "line_no_percent": updated_percent
-        }
-        out_commented = os.path.join(commented_folder, file_name)
-        try:
-            with open(out_commented, "w", encoding="utf-8") as f:
-                json.dump(commented_json, f, indent=2)
-        except Exception as e:
-            print(f"Error writing commented file {file_name}: {e}")
-            continue
-
-        try:
-            # b. Update variable names on original buggy code.
-            variable_code, new_line_variable = update_variable_names_str(buggy_code, bug_line, num_vars, vars_list)
-            total_lines = len(variable_code.splitlines())
-            updated_percent = f"{round((new_line_variable/total_lines)*100)}%"
-        except Exception as e:
-            print(f"Error updating variable names in {file_name}: {e}")
-            continue
-        variable_json = {
-            "instruction": instruction,
-            "buggy_code": variable_code,
-            "line_no": new_line_variable,
-            "line_no_percent": updated_percent
-        }
-        out_variable = os.path.join(variable_folder, file_name)
-        try:
-            with open(out_variable, "w", encoding="utf-8") as f:
-                json.dump(variable_json, f, indent=2)
-        except Exception as e:
-            print(f"Error writing variable file {file_name}: {e}")
-            continue
-
-        try:
-            # c. Insert dead code snippets on original buggy code.
-            dead_code_final, new_line_dead = insert_dead_code_snippets_str(buggy_code, bug_line, num_dead, dead_snippets)
-            total_lines = len(dead_code_final.splitlines())
-            updated_percent = f"{round((new_line_dead/total_lines)*100)}%"
-        except Exception as e:
-            print(f"Error inserting dead code in {file_name}: {e}")
-            continue
-        dead_code_json = {
-            "instruction": instruction,
-            "buggy_code": dead_code_final,
-            "line_no": new_line_dead,
-            "line_no_percent": updated_percent
-        }
-        out_dead = os.path.join(dead_code_folder, file_name)
-        try:
-            with open(out_dead, "w", encoding="utf-8") as f:
-                json.dump(dead_code_json, f, indent=2)
-        except Exception as e:
-            print(f"Error writing dead code file {file_name}: {e}")
-            continue
-
-        # Cumulative mutations: apply variable mutation on commented code, then dead code on that result.
-        try:
-            # d. Update variable names on the commented code.
-            variable_comm_code, new_line_var_comm = update_variable_names_str(commented_code, new_line_commented, num_vars, vars_list)
-            total_lines = len(variable_comm_code.splitlines())
-            updated_percent = f"{round((new_line_var_comm/total_lines)*100)}%"
-        except Exception as e:
-            print(f"Error updating variable names cumulatively in {file_name}: {e}")
-            continue
-        variable_comm_json = {
-            "instruction": instruction,
-            "buggy_code": variable_comm_code,
-            "line_no": new_line_var_comm,
-            "line_no_percent": updated_percent
-        }
-        out_variable_comm = os.path.join(variable_cumulative_folder, file_name)
-        try:
-            with open(out_variable_comm, "w", encoding="utf-8") as f:
-                json.dump(variable_comm_json, f, indent=2)
-        except Exception as e:
-            print(f"Error writing cumulative variable file {file_name}: {e}")
-            continue
-
-        try:
-            # e. Insert dead code snippets on the cumulative variable code.
-            dead_code_comm_code, new_line_dead_comm = insert_dead_code_snippets_str(variable_comm_code, new_line_var_comm, num_dead, dead_snippets)
-            total_lines = len(dead_code_comm_code.splitlines())
-            updated_percent = f"{round((new_line_dead_comm/total_lines)*100)}%"
-        except Exception as e:
-            print(f"Error inserting dead code cumulatively in {file_name}: {e}")
-            continue
-        dead_code_comm_json = {
-            "instruction": instruction,
-            "buggy_code": dead_code_comm_code,
-            "line_no": new_line_dead_comm,
-            "line_no_percent": updated_percent
-        }
-        out_dead_comm = os.path.join(dead_code_cumulative_folder, file_name)
-        try:
-            with open(out_dead_comm, "w", encoding="utf-8") as f:
-                json.dump(dead_code_comm_json, f, indent=2)
-        except Exception as e:
-            print(f"Error writing cumulative dead code file {file_name}: {e}")
-            continue
-
-        processed_count += 1
-        print(f"Processed {file_name}")
-
+    if jobs:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            done = ex.map(mutate_file, itertools.repeat(output_folder), *zip(*jobs), chunksize=8)
+            processed_count = sum(done)
     print(f"\nTotal files processed: {processed_count} out of {total_files}")
 
 def main():
-    if len(sys.argv) != 5:
-        print("Usage: python pipeline.py <dataset_folder> <output_folder> <max_inserts> <llm_model>")
+    args = sys.argv[1:]
+    shared_snippets = "--shared-snippets" in args
+    if shared_snippets:
+        args.remove("--shared-snippets")
+    if len(args) != 4:
+        print("Usage: python pipeline.py <dataset_folder> <output_folder> <max_inserts> <llm_model> [--shared-snippets]")
         sys.exit(1)
 
-    dataset_folder = sys.argv[1]         # Folder with original JSON files.
-    output_folder = sys.argv[2]           # Base output folder.
-    max_inserts = int(sys.argv[3])        # Max inserts for mutations.
-    llm_model = sys.argv[4]               # LLM model name.
-    process_dataset(dataset_folder, output_folder, max_inserts, llm_model)
+    dataset_folder = args[0]              # Folder with original JSON files.
+    output_folder = args[1]               # Base output folder.
+    max_inserts = int(args[2])            # Max inserts for mutations.
+    llm_model = args[3]                   # LLM model name.
+    process_dataset(dataset_folder, output_folder, max_inserts, llm_model, shared_snippets)
 
 if __name__ == "__main__":
     main()
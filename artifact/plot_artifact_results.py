@@ -6,86 +6,235 @@ Produces: results summary (with mutation strength 4 section and comparison) and
   2. Effect of mutation strength (1 vs 4) per SAM, all 5 SPMs.
   3. Mutation types (all 5 SPMs) with strength 1 vs 4 aggregated over SAMs.
   4. Windowed results: cumulative matches/mismatches by code-position window (0-25%, 25-50%, 50-75%, 75-100%).
+With --summary-only (or --no-plots), only the summary is written and matplotlib is never imported.
 """
-import json
+import argparse
+import multiprocessing as mp
 import os
-import sys
+from collections import Counter
+
+import orjson
 
 # 4 SAMs and 5 SPMs (must match run_artifact.sh)
 SAMS = ["BooleanLogic", "MisplacedReturn", "OffByOne", "OperatorSwap"]
 SPMS = ["commented", "variable", "dead_code", "variable_cumulative", "dead_code_cumulative"]
 SPM_LABELS = ["commented", "variable", "dead_code", "var_cumul", "dead_cumul"]
+SPM_COLORS = ["#4CAF50", "#81C784", "#A5D6A7", "#C8E6C9", "#2E7D32"]
+WINDOWS = ["0-25", "25-50", "50-75", "75-100"]
 WINDOW_LABELS = ["0-25%", "25-50%", "50-75%", "75-100%"]
 
 
+def scan_artifact_dir(artifact_dir: str) -> dict:
+    """Lists artifact_dir once. Maps each top-level directory name to the set of names it contains, and each "spm_*/<spm>" subdirectory likewise; only spm_* directories are listed (others map to an empty set). Existence checks are then answered from memory instead of one stat per path."""
+    tree = {}
+    with os.scandir(artifact_dir) as it:
+        top_dirs = [entry for entry in it if entry.is_dir()]
+    for entry in top_dirs:
+        tree[entry.name] = set()
+        if not entry.name.startswith("spm_"):
+            continue
+        with os.scandir(entry.path) as it:
+            sub_dirs = []
+            for sub in it:
+                tree[entry.name].add(sub.name)
+                if sub.is_dir():
+                    sub_dirs.append(sub)
+        for sub in sub_dirs:
+            with os.scandir(sub.path) as it:
+                tree[f"{entry.name}/{sub.name}"] = {e.name for e in it}
+    return tree
+
+
 def read_success_count(folder: str) -> int:
-    path = os.path.join(folder, "success.txt")
-    if not os.path.isfile(path):
+    try:
+        with open(os.path.join(folder, "success.txt"), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
         return 0
-    with open(path, "r", encoding="utf-8") as f:
-        return sum(1 for line in f if line.strip())
+    # One bulk read and a C-level split instead of decoding and iterating line by line.
+    return sum(1 for line in data.splitlines() if line.strip())
 
 
 def count_first_n(artifact_dir: str, sam: str, n: int) -> int:
     first_n_dir = os.path.join(artifact_dir, f"first{n}_{sam}")
-    if not os.path.isdir(first_n_dir):
+    # One scandir both checks that the folder exists and lists it with cached file types.
+    try:
+        with os.scandir(first_n_dir) as it:
+            return sum(1 for entry in it if entry.name.lower().endswith(".json") and entry.is_file())
+    except (FileNotFoundError, NotADirectoryError):
         return 0
-    return sum(1 for f in os.listdir(first_n_dir) if f.lower().endswith(".json"))
 
 
-def collect_windowed_results(artifact_dir: str):
-    """Aggregate windowed_results.json from all spm_* and spm_*_strength4/<spm> folders. Returns (matches_per_window, mismatches_per_window) as lists for 0-25, 25-50, 50-75, 75-100, or (None, None) if none found."""
-    windows = ["0-25", "25-50", "50-75", "75-100"]
-    agg_m = {w: 0 for w in windows}
-    agg_mm = {w: 0 for w in windows}
-    found = False
-    for sam in SAMS:
-        for base_name in [f"spm_{sam}", f"spm_{sam}_strength4"]:
-            base = os.path.join(artifact_dir, base_name)
-            if not os.path.isdir(base):
-                continue
-            for spm in SPMS:
-                path = os.path.join(base, spm, "windowed_results.json")
-                if not os.path.isfile(path):
-                    continue
-                try:
-                    with open(path, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    for w in windows:
-                        agg_m[w] += data.get("matches", {}).get(w, 0)
-                        agg_mm[w] += data.get("mismatches", {}).get(w, 0)
-                    found = True
-                except Exception:
-                    pass
-    if not found:
-        return None, None
-    return [agg_m[w] for w in windows], [agg_mm[w] for w in windows]
+def load_leaf(leaf_dir: str, names: set) -> dict:
+    """Read one spm_*/<spm> folder in a single pass, given the names it contains (from scan_artifact_dir). Returns {"success": count, "windowed": parsed windowed_results.json or None}."""
+    leaf = {"success": 0, "windowed": None}
+    if "success.txt" in names:
+        leaf["success"] = read_success_count(leaf_dir)
+    if "windowed_results.json" in names:
+        try:
+            with open(os.path.join(leaf_dir, "windowed_results.json"), "rb") as f:
+                leaf["windowed"] = orjson.loads(f.read())
+        except Exception:
+            pass
+    return leaf
+
+
+def _pyplot():
+    """Imports pyplot on the non-interactive Agg backend; called inside each rendering process."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def plot_graph1(spm_counts, sams_found: list, max_n: int, out_path: str) -> None:
+    """Graph 1: Initial accuracy drop with SPM (strength 1 only)."""
+    import numpy as np
+    plt = _pyplot()
+    x = np.arange(len(sams_found))
+    width = 0.15
+    multipliers = [-2, -1, 0, 1, 2]
+    fig1, ax1 = plt.subplots(figsize=(12, 6))
+    for i, spm in enumerate(SPMS):
+        counts = spm_counts[:, i, 0]
+        offset = width * multipliers[i]
+        bars = ax1.bar(x + offset, counts, width, label=SPM_LABELS[i], color=SPM_COLORS[i], edgecolor="black", linewidth=0.5)
+        ax1.bar_label(bars, padding=2, fontsize=8)
+    ax1.set_ylabel("Still localized (count)")
+    ax1.set_xlabel("SAM (bug type)")
+    ax1.set_title("Graph 1: Initial accuracy drop with SPM (mutation strength 1)")
+    ax1.set_xticks(x)
+    ax1.set_xticklabels(sams_found, rotation=15, ha="right")
+    ax1.legend(loc="upper right", fontsize=8)
+    ax1.set_ylim(0, max_n + 1)
+    ax1.axhline(y=max_n, color="gray", linestyle="--", alpha=0.5)
+    plt.tight_layout()
+    plt.savefig(out_path, dpi=150)
+    plt.close()
+
+
+def plot_graph2(spm_counts, sams_found: list, max_n: int, out_path: str) -> None:
+    """Graph 2: Effect of mutation strength (1 vs 4) per SAM, all 5 SPMs."""
+    import matplotlib.colors as mcolors
+    import numpy as np
+    plt = _pyplot()
+    x = np.arange(len(sams_found))
+    # Darker shades of the same colors mark strength 4.
+    dark_colors = [mcolors.to_hex([max(0, c - 0.25) for c in mcolors.to_rgb(col)]) for col in SPM_COLORS]
+    # Per SAM: 5 SPMs × 2 strengths = 10 bars
+    fig2, ax2 = plt.subplots(figsize=(14, 6))
+    bar_w = 0.04
+    for i, spm in enumerate(SPMS):
+        for j, strength in enumerate([1, 4]):
+            counts = spm_counts[:, i, j]
+            if strength == 1:
+                label = f"{SPM_LABELS[i]} (str 1)"
+                color = SPM_COLORS[i]
+            else:
+                label = f"{SPM_LABELS[i]} (str 4)"
+                color = dark_colors[i]
+            offset = (i * 2 + j) * 0.05 - 0.45
+            bars = ax2.bar(x + offset, counts, bar_w, label=label, color=color, edgecolor="black", linewidth=0.3)
+            ax2.bar_label(bars, padding=2, fontsize=7)
+    ax2.set_ylabel("Still localized (count)")
+    ax2.set_xlabel("SAM (bug type)")
+    ax2.set_title("Graph 2: Effect of mutation strength (1 vs 4) per SAM, all 5 SPMs")
+    ax2.set_xticks(x)
+    ax2.set_xticklabels(sams_found, rotation=15, ha="right")
+    ax2.legend(loc="upper right", fontsize=7, ncol=2)
+    ax2.set_ylim(0, max_n + 1)
+    plt.tight_layout()
+    plt.savefig(out_path, dpi=150)
+    plt.close()
+
+
+def plot_graph3(spm_counts, out_path: str) -> None:
+    """Graph 3: Mutation types (all 5 SPMs), strength 1 vs 4 aggregated over SAMs."""
+    import numpy as np
+    plt = _pyplot()
+    fig3, ax3 = plt.subplots(figsize=(10, 6))
+    x3 = np.arange(len(SPMS))
+    w = 0.35
+    sum_s1, sum_s4 = spm_counts.sum(axis=0).T
+    bars1 = ax3.bar(x3 - w / 2, sum_s1, w, label="Strength 1", color="#4CAF50", edgecolor="black", linewidth=0.5)
+    bars4 = ax3.bar(x3 + w / 2, sum_s4, w, label="Strength 4", color="#1976D2", edgecolor="black", linewidth=0.5)
+    ax3.bar_label(bars1, padding=2, fontsize=9)
+    ax3.bar_label(bars4, padding=2, fontsize=9)
+    ax3.set_ylabel("Still localized (count, summed over SAMs)")
+    ax3.set_xlabel("SPM (mutation type)")
+    ax3.set_title("Graph 3: Mutation types (all 5 SPMs) — strength 1 vs 4")
+    ax3.set_xticks(x3)
+    ax3.set_xticklabels(SPM_LABELS, rotation=15, ha="right")
+    ax3.legend()
+    ax3.set_ylim(0, max(int(spm_counts.sum(axis=0).max()) + 2, 1))
+    plt.tight_layout()
+    plt.savefig(out_path, dpi=150)
+    plt.close()
+
+
+def plot_graph4(win_m: list, win_mm: list, out_path: str) -> None:
+    """Graph 4: Windowed results (cumulative) by code-position window."""
+    import numpy as np
+    plt = _pyplot()
+    fig4, ax4 = plt.subplots(figsize=(8, 5))
+    x4 = np.arange(len(WINDOW_LABELS))
+    w4 = 0.35
+    bars_m = ax4.bar(x4 - w4 / 2, win_m, w4, label="Matches", color="#4CAF50", edgecolor="black", linewidth=0.5)
+    bars_mm = ax4.bar(x4 + w4 / 2, win_mm, w4, label="Mismatches", color="#E53935", edgecolor="black", linewidth=0.5)
+    # Zero-height bars stay unlabeled.
+    ax4.bar_label(bars_m, labels=[str(c) if c > 0 else "" for c in win_m], padding=2, fontsize=9)
+    ax4.bar_label(bars_mm, labels=[str(c) if c > 0 else "" for c in win_mm], padding=2, fontsize=9)
+    ax4.set_ylabel("Count (cumulative)")
+    ax4.set_xlabel("Code position (line number %)")
+    ax4.set_title("Graph 4: Windowed results — matches vs mismatches by code position")
+    ax4.set_xticks(x4)
+    ax4.set_xticklabels(WINDOW_LABELS)
+    ax4.legend()
+    ax4.set_ylim(0, max(max(win_m + win_mm) + 2, 1))
+    plt.tight_layout()
+    plt.savefig(out_path, dpi=150)
+    plt.close()
 
 
 def main():
-    artifact_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__))
-    n_per_sam_default = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    parser = argparse.ArgumentParser(description="Summarize and plot the artifact results.")
+    parser.add_argument("artifact_dir", nargs="?", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("n", nargs="?", type=int, default=5, help="first-N value used per SAM (default: 5)")
+    parser.add_argument("--summary-only", "--no-plots", action="store_true", help="write results_summary.txt and skip the graphs")
+    args = parser.parse_args()
+    artifact_dir = args.artifact_dir
+    n_per_sam_default = args.n
+
+    tree = scan_artifact_dir(artifact_dir)
 
-    # Collect strength 1: sam -> spm -> count
+    # One walk over every spm_*/<spm> and spm_*_strength4/<spm> folder collects both the
+    # success counts (sam -> spm -> count, per strength) and the windowed results, which
+    # are summed over all folders, including strength 4 of SAMs without strength 1.
     results = {}
     results_strength4 = {}
     n_per_sam = {}
+    agg_m = Counter()
+    agg_mm = Counter()
+    windowed_found = False
     for sam in SAMS:
-        spm_base = os.path.join(artifact_dir, f"spm_{sam}")
-        spm_base_4 = os.path.join(artifact_dir, f"spm_{sam}_strength4")
-        if not os.path.isdir(spm_base):
-            continue
-        n_per_sam[sam] = count_first_n(artifact_dir, sam, n_per_sam_default) or n_per_sam_default
-        results[sam] = {}
+        base_name = f"spm_{sam}"
+        base_name_4 = f"spm_{sam}_strength4"
+        if base_name in tree:
+            n_per_sam[sam] = count_first_n(artifact_dir, sam, n_per_sam_default) or n_per_sam_default
+            results[sam] = {}
+            results_strength4[sam] = {}
         for spm in SPMS:
-            results[sam][spm] = read_success_count(os.path.join(spm_base, spm))
-        results_strength4[sam] = {}
-        if os.path.isdir(spm_base_4):
-            for spm in SPMS:
-                results_strength4[sam][spm] = read_success_count(os.path.join(spm_base_4, spm))
-        else:
-            for spm in SPMS:
-                results_strength4[sam][spm] = 0
+            for base, counts in [(base_name, results.get(sam)), (base_name_4, results_strength4.get(sam))]:
+                leaf = {"success": 0, "windowed": None}
+                if base in tree:
+                    leaf = load_leaf(os.path.join(artifact_dir, base, spm), tree.get(f"{base}/{spm}", set()))
+                if counts is not None:
+                    counts[spm] = leaf["success"]
+                if leaf["windowed"] is not None:
+                    # Counter.update adds whole per-window mappings at once.
+                    agg_m.update(leaf["windowed"].get("matches", {}))
+                    agg_mm.update(leaf["windowed"].get("mismatches", {}))
+                    windowed_found = True
 
     if not results:
         print("No SAM results found under artifact_dir. Run run_artifact.sh first.")
@@ -135,7 +284,10 @@ def main():
                 c4 = results_strength4.get(sam, {}).get(spm, 0)
                 f.write(f"  SPM ({spm:22s}): strength1={c1:2d}  strength4={c4:2d}\n")
             f.write("\n")
-    win_m, win_mm = collect_windowed_results(artifact_dir)
+    win_m, win_mm = None, None
+    if windowed_found:
+        win_m = [agg_m[w] for w in WINDOWS]
+        win_mm = [agg_mm[w] for w in WINDOWS]
     if win_m is not None and win_mm is not None:
         with open(summary_path, "a", encoding="utf-8") as f:
             f.write("=" * 80 + "\n\n")
@@ -145,11 +297,11 @@ def main():
                 f.write(f"  Window {w}: Matches = {win_m[i]}, Mismatches = {win_mm[i]}\n")
             f.write("\n")
     print(f"Summary written to {summary_path}")
+    if args.summary_only:
+        return
 
     try:
-        import matplotlib
-        matplotlib.use("Agg")
-        import matplotlib.pyplot as plt
+        import matplotlib  # noqa: F401
         import numpy as np
     except ImportError:
         print("matplotlib not available; skipping graphs.")
@@ -159,151 +311,32 @@ def main():
     if not sams_found:
         return
     max_n = max(n_per_sam.get(s, n_per_sam_default) for s in sams_found)
-    has_strength4 = any(os.path.isdir(os.path.join(artifact_dir, f"spm_{s}_strength4")) for s in sams_found)
+    has_strength4 = any(f"spm_{s}_strength4" in tree for s in sams_found)
 
-    x = np.arange(len(sams_found))
-    width = 0.15
-    multipliers = [-2, -1, 0, 1, 2]
-    colors = ["#4CAF50", "#81C784", "#A5D6A7", "#C8E6C9", "#2E7D32"]
+    # Still-localized counts indexed [sam, spm, strength] (strength 1, strength 4).
+    spm_counts = np.zeros((len(sams_found), len(SPMS), 2), dtype=np.int64)
+    for i, sam in enumerate(sams_found):
+        for j, spm in enumerate(SPMS):
+            spm_counts[i, j, 0] = results[sam].get(spm, 0)
+            spm_counts[i, j, 1] = results_strength4.get(sam, {}).get(spm, 0)
 
-    # ---- Graph 1: Initial accuracy drop with SPM (strength 1 only) ----
-    fig1, ax1 = plt.subplots(figsize=(12, 6))
-    for i, spm in enumerate(SPMS):
-        counts = [results[sam].get(spm, 0) for sam in sams_found]
-        offset = width * multipliers[i]
-        bars = ax1.bar(x + offset, counts, width, label=SPM_LABELS[i], color=colors[i], edgecolor="black", linewidth=0.5)
-        for b, c in zip(bars, counts):
-            ax1.annotate(str(c), xy=(b.get_x() + b.get_width() / 2, b.get_height()), xytext=(0, 2), textcoords="offset points", ha="center", va="bottom", fontsize=8)
-    ax1.set_ylabel("Still localized (count)")
-    ax1.set_xlabel("SAM (bug type)")
-    ax1.set_title("Graph 1: Initial accuracy drop with SPM (mutation strength 1)")
-    ax1.set_xticks(x)
-    ax1.set_xticklabels(sams_found, rotation=15, ha="right")
-    ax1.legend(loc="upper right", fontsize=8)
-    ax1.set_ylim(0, max_n + 1)
-    ax1.axhline(y=max_n, color="gray", linestyle="--", alpha=0.5)
-    plt.tight_layout()
-    out1 = os.path.join(artifact_dir, "artifact_results.png")
-    plt.savefig(out1, dpi=150)
-    plt.close()
-    print(f"Graph 1 saved to {out1}")
-
-    if not has_strength4:
-        print("No strength-4 data found; skipping graphs 2 and 3.")
-        # Still plot Graph 4 (windowed) if we have data, then exit.
-        if win_m is not None and win_mm is not None:
-            fig4, ax4 = plt.subplots(figsize=(8, 5))
-            x4 = np.arange(len(WINDOW_LABELS))
-            w4 = 0.35
-            bars_m = ax4.bar(x4 - w4 / 2, win_m, w4, label="Matches", color="#4CAF50", edgecolor="black", linewidth=0.5)
-            bars_mm = ax4.bar(x4 + w4 / 2, win_mm, w4, label="Mismatches", color="#E53935", edgecolor="black", linewidth=0.5)
-            for b in bars_m:
-                if b.get_height() > 0:
-                    ax4.annotate(str(int(b.get_height())), xy=(b.get_x() + b.get_width() / 2, b.get_height()), xytext=(0, 2), textcoords="offset points", ha="center", va="bottom", fontsize=9)
-            for b in bars_mm:
-                if b.get_height() > 0:
-                    ax4.annotate(str(int(b.get_height())), xy=(b.get_x() + b.get_width() / 2, b.get_height()), xytext=(0, 2), textcoords="offset points", ha="center", va="bottom", fontsize=9)
-            ax4.set_ylabel("Count (cumulative)")
-            ax4.set_xlabel("Code position (line number %)")
-            ax4.set_title("Graph 4: Windowed results — matches vs mismatches by code position")
-            ax4.set_xticks(x4)
-            ax4.set_xticklabels(WINDOW_LABELS)
-            ax4.legend()
-            ax4.set_ylim(0, max(max(win_m + win_mm) + 2, 1))
-            plt.tight_layout()
-            out4 = os.path.join(artifact_dir, "artifact_results_windowed.png")
-            plt.savefig(out4, dpi=150)
-            plt.close()
-            print(f"Graph 4 saved to {out4}")
-        else:
-            print("No windowed_results.json found; skipping graph 4.")
-        return
-
-    # ---- Graph 2: Effect of mutation strength (1 vs 4) per SAM, all 5 SPMs ----
-    # Per SAM: 5 SPMs × 2 strengths = 10 bars
-    fig2, ax2 = plt.subplots(figsize=(14, 6))
-    n_spms = len(SPMS)
-    bar_w = 0.04
-    for i, spm in enumerate(SPMS):
-        for j, strength in enumerate([1, 4]):
-            if strength == 1:
-                counts = [results[sam].get(spm, 0) for sam in sams_found]
-                label = f"{SPM_LABELS[i]} (str 1)"
-                color = colors[i]
-            else:
-                counts = [results_strength4.get(sam, {}).get(spm, 0) for sam in sams_found]
-                label = f"{SPM_LABELS[i]} (str 4)"
-                import matplotlib.colors as mcolors
-                rgb = mcolors.to_rgb(colors[i])
-                color = mcolors.to_hex([max(0, c - 0.25) for c in rgb])
-            offset = (i * 2 + j) * 0.05 - 0.45
-            bars = ax2.bar(x + offset, counts, bar_w, label=label, color=color, edgecolor="black", linewidth=0.3)
-            for b, c in zip(bars, counts):
-                ax2.annotate(str(c), xy=(b.get_x() + b.get_width() / 2, b.get_height()), xytext=(0, 2), textcoords="offset points", ha="center", va="bottom", fontsize=7)
-    ax2.set_ylabel("Still localized (count)")
-    ax2.set_xlabel("SAM (bug type)")
-    ax2.set_title("Graph 2: Effect of mutation strength (1 vs 4) per SAM, all 5 SPMs")
-    ax2.set_xticks(x)
-    ax2.set_xticklabels(sams_found, rotation=15, ha="right")
-    ax2.legend(loc="upper right", fontsize=7, ncol=2)
-    ax2.set_ylim(0, max_n + 1)
-    plt.tight_layout()
-    out2 = os.path.join(artifact_dir, "artifact_results_strength_comparison.png")
-    plt.savefig(out2, dpi=150)
-    plt.close()
-    print(f"Graph 2 saved to {out2}")
-
-    # ---- Graph 3: Mutation types (all 5 SPMs), strength 1 vs 4 aggregated over SAMs ----
-    fig3, ax3 = plt.subplots(figsize=(10, 6))
-    x3 = np.arange(len(SPMS))
-    w = 0.35
-    sum_s1 = [sum(results.get(sam, {}).get(spm, 0) for sam in sams_found) for spm in SPMS]
-    sum_s4 = [sum(results_strength4.get(sam, {}).get(spm, 0) for sam in sams_found) for spm in SPMS]
-    bars1 = ax3.bar(x3 - w / 2, sum_s1, w, label="Strength 1", color="#4CAF50", edgecolor="black", linewidth=0.5)
-    bars4 = ax3.bar(x3 + w / 2, sum_s4, w, label="Strength 4", color="#1976D2", edgecolor="black", linewidth=0.5)
-    for b in bars1:
-        ax3.annotate(str(int(b.get_height())), xy=(b.get_x() + b.get_width() / 2, b.get_height()), xytext=(0, 2), textcoords="offset points", ha="center", va="bottom", fontsize=9)
-    for b in bars4:
-        ax3.annotate(str(int(b.get_height())), xy=(b.get_x() + b.get_width() / 2, b.get_height()), xytext=(0, 2), textcoords="offset points", ha="center", va="bottom", fontsize=9)
-    ax3.set_ylabel("Still localized (count, summed over SAMs)")
-    ax3.set_xlabel("SPM (mutation type)")
-    ax3.set_title("Graph 3: Mutation types (all 5 SPMs) — strength 1 vs 4")
-    ax3.set_xticks(x3)
-    ax3.set_xticklabels(SPM_LABELS, rotation=15, ha="right")
-    ax3.legend()
-    ax3.set_ylim(0, max(max(sum_s1 + sum_s4) + 2, 1))
-    plt.tight_layout()
-    out3 = os.path.join(artifact_dir, "artifact_results_mutation_types.png")
-    plt.savefig(out3, dpi=150)
-    plt.close()
-    print(f"Graph 3 saved to {out3}")
-
-    # ---- Graph 4: Windowed results (cumulative) ----
+    # (graph number, function, args); each graph is an independent figure.
+    jobs = [(1, plot_graph1, (spm_counts, sams_found, max_n, os.path.join(artifact_dir, "artifact_results.png")))]
+    if has_strength4:
+        jobs.append((2, plot_graph2, (spm_counts, sams_found, max_n, os.path.join(artifact_dir, "artifact_results_strength_comparison.png"))))
+        jobs.append((3, plot_graph3, (spm_counts, os.path.join(artifact_dir, "artifact_results_mutation_types.png"))))
     if win_m is not None and win_mm is not None:
-        fig4, ax4 = plt.subplots(figsize=(8, 5))
-        x4 = np.arange(len(WINDOW_LABELS))
-        w4 = 0.35
-        bars_m = ax4.bar(x4 - w4 / 2, win_m, w4, label="Matches", color="#4CAF50", edgecolor="black", linewidth=0.5)
-        bars_mm = ax4.bar(x4 + w4 / 2, win_mm, w4, label="Mismatches", color="#E53935", edgecolor="black", linewidth=0.5)
-        for b in bars_m:
-            if b.get_height() > 0:
-                ax4.annotate(str(int(b.get_height())), xy=(b.get_x() + b.get_width() / 2, b.get_height()), xytext=(0, 2), textcoords="offset points", ha="center", va="bottom", fontsize=9)
-        for b in bars_mm:
-            if b.get_height() > 0:
-                ax4.annotate(str(int(b.get_height())), xy=(b.get_x() + b.get_width() / 2, b.get_height()), xytext=(0, 2), textcoords="offset points", ha="center", va="bottom", fontsize=9)
-        ax4.set_ylabel("Count (cumulative)")
-        ax4.set_xlabel("Code position (line number %)")
-        ax4.set_title("Graph 4: Windowed results — matches vs mismatches by code position")
-        ax4.set_xticks(x4)
-        ax4.set_xticklabels(WINDOW_LABELS)
-        ax4.legend()
-        ax4.set_ylim(0, max(max(win_m + win_mm) + 2, 1))
-        plt.tight_layout()
-        out4 = os.path.join(artifact_dir, "artifact_results_windowed.png")
-        plt.savefig(out4, dpi=150)
-        plt.close()
-        print(f"Graph 4 saved to {out4}")
-    else:
+        jobs.append((4, plot_graph4, (win_m, win_mm, os.path.join(artifact_dir, "artifact_results_windowed.png"))))
+
+    # savefig (Agg rendering + PNG compression) is single-threaded and GIL-bound, so render each graph in its own process.
+    with mp.get_context("spawn").Pool(min(len(jobs), os.cpu_count() or 1)) as pool:
+        pending = [(num, args[-1], pool.apply_async(func, args)) for num, func, args in jobs]
+        for num, out_path, res in pending:
+            res.get()
+            print(f"Graph {num} saved to {out_path}")
+            if num == 1 and not has_strength4:
+                print("No strength-4 data found; skipping graphs 2 and 3.")
+    if win_m is None or win_mm is None:
         print("No windowed_results.json found; skipping graph 4.")
 
 
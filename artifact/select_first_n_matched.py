@@ -2,26 +2,61 @@
 """
 Select the first N matched programs (by filename order) from a matched folder
 produced by test_llm_original.py. Used by the artifact to fix the seed to 10 programs.
+The files are only read afterwards, so by default they are hard-linked rather than
+copied (--mode=copy forces a copy).
 """
 import os
 import sys
 import shutil
 
+MODES = ("hardlink", "copy")
+
+
+def place_file(src: str, dst: str, mode: str) -> None:
+    """Hard-links src to dst (replacing dst), or copies its contents when mode is "copy" or linking fails, e.g. across filesystems."""
+    # dst already is src, e.g. when the output folder is the matched folder: nothing to do,
+    # and removing dst would delete the only copy.
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+    if mode == "hardlink":
+        # Link under a temporary name and rename it over dst, so dst is only replaced once
+        # the new link exists.
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        try:
+            os.link(src, tmp)
+        except OSError:
+            pass
+        else:
+            try:
+                os.replace(tmp, dst)
+                return
+            except OSError:
+                os.remove(tmp)
+    # copyfile uses os.sendfile on Linux and skips copy2's metadata copy.
+    shutil.copyfile(src, dst)
+
 
 def main():
-    if len(sys.argv) < 4:
-        print("Usage: python select_first_n_matched.py <matched_folder> <output_folder> <n>")
+    args = sys.argv[1:]
+    mode = "hardlink"
+    for arg in list(args):
+        if arg.startswith("--mode="):
+            mode = arg.split("=", 1)[1]
+            args.remove(arg)
+    if len(args) < 3 or mode not in MODES:
+        print("Usage: python select_first_n_matched.py <matched_folder> <output_folder> <n> [--mode=hardlink|copy]")
         sys.exit(1)
 
-    matched_folder = sys.argv[1]
-    output_folder = sys.argv[2]
-    n = int(sys.argv[3])
+    matched_folder = args[0]
+    output_folder = args[1]
+    n = int(args[2])
 
     if not os.path.isdir(matched_folder):
         print(f"Error: matched folder not found: {matched_folder}")
         sys.exit(1)
 
-    json_files = sorted([f for f in os.listdir(matched_folder) if f.lower().endswith(".json")])
+    with os.scandir(matched_folder) as it:
+        json_files = sorted(entry.name for entry in it if entry.name.lower().endswith(".json") and entry.is_file())
     selected = json_files[:n]
 
     if len(selected) < n:
@@ -31,7 +66,7 @@ def main():
     for f in selected:
         src = os.path.join(matched_folder, f)
         dst = os.path.join(output_folder, f)
-        shutil.copy2(src, dst)
+        place_file(src, dst, mode)
 
     print(f"Copied first {len(selected)} matched programs to {output_folder}")
 
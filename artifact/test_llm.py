@@ -1,24 +1,43 @@
 from pydantic import BaseModel
-import json
-import re
+import orjson
 import os
 import shutil
 import sys
 import csv
-from ollama import chat
+import bisect
+import io
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ollama import Client
 
 # Default model name, can be overwritten from the command line.
 LLM_MODEL = "qwen2.5-coder"
 
+# One client shared by all worker threads, so HTTP connections are reused across files.
+client = Client()
+# Keep the model loaded between requests. The answer is a tiny JSON object, so cap its length.
+KEEP_ALIVE = "10m"
+CHAT_OPTIONS = {"num_predict": 32}
+
 class BugLine(BaseModel):
     line_no: int
 
-def ask_llm_for_bug_line(instruction: str, buggy_code: str) -> int:
+# Code-position windows by line_no_percent: [0, 25), [25, 50), [50, 75) and [75, 100].
+WINDOW_BOUNDS = (25.0, 50.0, 75.0)
+WINDOW_KEYS = ("0-25", "25-50", "50-75", "75-100")
+
+# The schema never changes, so build it once rather than on every request.
+BUG_LINE_SCHEMA = BugLine.model_json_schema()
+
+def ask_llm_for_bug_line(instruction: str, buggy_code: str) -> tuple:
     """
     Calls the LLM with a structured format to obtain the bug's exact line number.
-    Returns the predicted line number (int) or -1 if parsing fails.
+    Returns (predicted line number, None), or (-1, message) if parsing fails; main() prints
+    the message with the file's other output.
     """
-    response = chat(
+    response = client.chat(
         messages=[
             {
                 'role': 'user',
@@ -28,30 +47,123 @@ def ask_llm_for_bug_line(instruction: str, buggy_code: str) -> int:
             }
         ],
         model=LLM_MODEL,
-        format=BugLine.model_json_schema()
+        format=BUG_LINE_SCHEMA,
+        options=CHAT_OPTIONS,
+        keep_alive=KEEP_ALIVE,
+        stream=False
     )
 
     try:
         bug_line_obj = BugLine.model_validate_json(response.message.content)
-        return bug_line_obj.line_no
+        return bug_line_obj.line_no, None
     except Exception as e:
-        print("Failed to parse LLM response as JSON:", response.message.content)
-        return -1
-    
+        return -1, f"Failed to parse LLM response as JSON: {response.message.content}"
+
+###############################################################################
+# Persistent prediction cache
+###############################################################################
+
+# Predictions are cached per model in CACHE_DIR/<model>.sqlite, keyed on the program, so
+# re-running on inputs seen before (e.g. across strengths or SPMs) skips the LLM call.
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "test_llm")
+cache_db = None
+cache_lock = threading.Lock()
+
+def open_cache(model: str) -> sqlite3.Connection:
+    """
+    Opens (creating if needed) the prediction cache of the given model. The connection is
+    shared by the worker threads; every access holds cache_lock.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    db_name = model.replace(os.sep, "_").replace(":", "_") + ".sqlite"
+    db = sqlite3.connect(os.path.join(CACHE_DIR, db_name), check_same_thread=False, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("CREATE TABLE IF NOT EXISTS cache (key BLOB PRIMARY KEY, pred INTEGER)")
+    return db
+
+def ask_llm_cached(instruction: str, buggy_code: str) -> tuple:
+    """
+    Returns the cached prediction for this program if there is one; otherwise asks the LLM
+    and caches the answer. Invalid answers (-1) are not cached, so they are retried.
+    Returns (prediction, message) like ask_llm_for_bug_line.
+    """
+    if cache_db is None:
+        return ask_llm_for_bug_line(instruction, buggy_code)
+    key = hashlib.blake2b(f"{LLM_MODEL}\0{instruction}\0{buggy_code}".encode("utf-8"), digest_size=16).digest()
+    with cache_lock:
+        row = cache_db.execute("SELECT pred FROM cache WHERE key = ?", (key,)).fetchone()
+    if row is not None:
+        return row[0], None
+    predicted_line_no, message = ask_llm_for_bug_line(instruction, buggy_code)
+    if predicted_line_no is not None and predicted_line_no != -1:
+        with cache_lock:
+            cache_db.execute("INSERT OR IGNORE INTO cache (key, pred) VALUES (?, ?)", (key, predicted_line_no))
+    return predicted_line_no, message
+
+def process_file(entry: os.DirEntry) -> tuple:
+    """
+    Reads one buggy JSON file and asks the LLM for the bug line. Runs in a worker thread,
+    so it only reports the outcome; main() updates the counters.
+    Returns (verdict, window, original_line_no, predicted_line_no, message) where verdict is
+    "match", "mismatch", "invalid" (no usable LLM answer), "skip" (bad fields) or "error"
+    (unreadable file); message explains "skip", "error" and an unparsable answer ("invalid").
+    """
+    filename = entry.name
+    try:
+        with open(entry.path, "rb") as f:
+            data = orjson.loads(f.read())
+    except Exception as e:
+        return "error", None, None, None, f"Error reading {filename}: {e}"
+
+    # Each JSON is expected to have "instruction", "buggy_code", "line_no", and "line_no_percent"
+    instruction = data.get("instruction", "").strip()
+    buggy_code = data.get("buggy_code", "").strip()
+    original_line_no = data.get("line_no")
+    line_no_percent = data.get("line_no_percent", "").strip()
+
+    if not instruction or not buggy_code or original_line_no is None or not line_no_percent:
+        return "skip", None, None, None, f"Missing required fields in {filename}. Skipping."
+
+    # Determine the window based on line_no_percent.
+    try:
+        percent_value = float(line_no_percent.rstrip('%'))
+    except ValueError:
+        return "skip", None, None, None, f"Invalid line_no_percent value in {filename}. Skipping."
+
+    window = WINDOW_KEYS[bisect.bisect_right(WINDOW_BOUNDS, percent_value)]
+
+    # Ask LLM for the bug line using a new context.
+    predicted_line_no, message = ask_llm_cached(instruction, buggy_code)
+    if predicted_line_no is None or predicted_line_no == -1:
+        return "invalid", window, original_line_no, predicted_line_no, message
+
+    verdict = "match" if abs(predicted_line_no - original_line_no) <= 2 else "mismatch"
+    return verdict, window, original_line_no, predicted_line_no, None
+
 def main(): 
+    # --no-cache always asks the LLM (e.g. for benchmarking) and leaves the cache untouched.
+    global LLM_MODEL, cache_db
+    args = sys.argv[1:]
+    use_cache = "--no-cache" not in args
+    if not use_cache:
+        args.remove("--no-cache")
+
     # First argument is the LLM model.
-    global LLM_MODEL
-    LLM_MODEL = sys.argv[1] if len(sys.argv) > 1 else LLM_MODEL
+    LLM_MODEL = args[0] if len(args) > 0 else LLM_MODEL
     print(f"Using LLM model: {LLM_MODEL}")
 
     # Second argument is the input folder containing the buggy JSON files.
-    buggy_dataset_folder = sys.argv[2] if len(sys.argv) > 2 else None
+    buggy_dataset_folder = args[1] if len(args) > 1 else None
     if not buggy_dataset_folder:
         print("Input folder is required. Exiting.")
         sys.exit(1)
     
     # Optional third argument is the output folder for matched files.
-    output_folder = sys.argv[3] if len(sys.argv) > 3 else None
+    output_folder = args[2] if len(args) > 2 else None
+
+    if use_cache:
+        cache_db = open_cache(LLM_MODEL)
 
     success_count = 0 
     failure_count = 0 
@@ -69,76 +181,58 @@ def main():
     if output_folder is not None and not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    # Process every JSON file in the buggy_dataset folder.
-    for filename in os.listdir(buggy_dataset_folder):
-        if not filename.lower().endswith(".json"):
-            continue
-        file_path = os.path.join(buggy_dataset_folder, filename)
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception as e:
-            print(f"Error reading {filename}: {e}")
-            continue
-
-        # Each JSON is expected to have "instruction", "buggy_code", "line_no", and "line_no_percent"
-        instruction = data.get("instruction", "").strip()
-        buggy_code = data.get("buggy_code", "").strip()
-        original_line_no = data.get("line_no")
-        line_no_percent = data.get("line_no_percent", "").strip()
-        
-        if not instruction or not buggy_code or original_line_no is None or not line_no_percent:
-            print(f"Missing required fields in {filename}. Skipping.")
-            failure_count += 1
-            continue
-
-        # Determine the window based on line_no_percent.
-        try:
-            percent_value = float(line_no_percent.strip('%'))
-        except ValueError:
-            print(f"Invalid line_no_percent value in {filename}. Skipping.")
-            failure_count += 1
-            continue
-
-        if percent_value < 25:
-            window = "0-25"
-        elif percent_value < 50:
-            window = "25-50"
-        elif percent_value < 75:
-            window = "50-75"
-        else:
-            window = "75-100"
-
-        print(f"\nProcessing {filename}:")
-        print(f"  Original line number: {original_line_no}")
-
-        # Ask LLM for the bug line using a new context.
-        predicted_line_no = ask_llm_for_bug_line(instruction, buggy_code)
-        if predicted_line_no is None or predicted_line_no == -1:
-            print("  LLM did not return a valid line number. Skipping file.")
-            failure_count += 1
-            continue
-
-        if abs(predicted_line_no - original_line_no) <= 2:
-            print(f"  LLM predicted line number: {original_line_no}")
-            print("  Verdict: MATCH")
-            success_count += 1
-            match_counts[window] += 1
-            success_files.append(filename)
-            # If output folder is provided, copy the file to that folder.
-            if output_folder is not None:
-                shutil.copy(file_path, os.path.join(output_folder, filename))
-        else:
-            print(f"  LLM predicted line number: {predicted_line_no}")
-            print("  Verdict: MISMATCH")
-            failure_count += 1
-            mismatch_counts[window] += 1
-            failure_files.append(filename)
-
-        total_count += 1
-        print(f"  Total Count: {total_count}")
-        print(f"  Success count (match): {success_count}")
-        print(f"  Failure count (mismatch or error): {failure_count}")
+    # Process every JSON file in the buggy_dataset folder. scandir yields each entry's type
+    # without an extra stat call per file.
+    with os.scandir(buggy_dataset_folder) as it:
+        entries = [entry for entry in it if entry.name.lower().endswith(".json") and entry.is_file()]
+
+    # LLM requests run in a thread pool; results are consumed here, in file order, so the
+    # counters and output need no locking. Match the worker count to OLLAMA_NUM_PARALLEL
+    # of the Ollama server. Ollama reads 0 as "choose automatically", which is not a valid
+    # worker count, so use at least 1.
+    max_workers = max(1, int(os.environ.get("OLLAMA_NUM_PARALLEL", "8")))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(process_file, entries)
+        for entry, (verdict, window, original_line_no, predicted_line_no, message) in zip(entries, results):
+            filename = entry.name
+            if verdict == "error":
+                print(message)
+                continue
+            if verdict == "skip":
+                print(message)
+                failure_count += 1
+                continue
+
+            print(f"\nProcessing {filename}:")
+            print(f"  Original line number: {original_line_no}")
+
+            if verdict == "invalid":
+                if message is not None:
+                    print(message)
+                print("  LLM did not return a valid line number. Skipping file.")
+                failure_count += 1
+                continue
+
+            if verdict == "match":
+                print(f"  LLM predicted line number: {original_line_no}")
+                print("  Verdict: MATCH")
+                success_count += 1
+                match_counts[window] += 1
+                success_files.append(filename)
+                # If output folder is provided, copy the file to that folder.
+                if output_folder is not None:
+                    shutil.copy(entry.path, os.path.join(output_folder, filename))
+            else:
+                print(f"  LLM predicted line number: {predicted_line_no}")
+                print("  Verdict: MISMATCH")
+                failure_count += 1
+                mismatch_counts[window] += 1
+                failure_files.append(filename)
+
+            total_count += 1
+            print(f"  Total Count: {total_count}")
+            print(f"  Success count (match): {success_count}")
+            print(f"  Failure count (mismatch or error): {failure_count}")
 
     print("\nSummary:")
     print(f"  Tested Folder: {buggy_dataset_folder}")
@@ -215,13 +309,18 @@ def main():
 
     # Write header and row to results.csv.
     try:
-        # If the file exists, append a new row; otherwise, create a new file with header.
-        file_exists = os.path.exists(csv_file)
-        with open(csv_file, "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            if not file_exists:
+        # Append with a single O_APPEND write, so concurrent test_llm runs cannot interleave
+        # their rows; the header is only written into an empty (new) file.
+        fd = os.open(csv_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            if os.fstat(fd).st_size == 0:
                 writer.writerow(header)
             writer.writerow(row)
+            os.write(fd, buf.getvalue().encode("utf-8"))
+        finally:
+            os.close(fd)
         print(f"\nResults written to {csv_file}")
     except Exception as e:
         print(f"Error writing to {csv_file}: {e}")
@@ -248,8 +347,8 @@ def main():
             "matches": {w: match_counts[w] for w in ["0-25", "25-50", "50-75", "75-100"]},
             "mismatches": {w: mismatch_counts[w] for w in ["0-25", "25-50", "50-75", "75-100"]},
         }
-        with open(windowed_path, "w", encoding="utf-8") as f:
-            json.dump(windowed, f, indent=2)
+        with open(windowed_path, "wb") as f:
+            f.write(orjson.dumps(windowed, option=orjson.OPT_INDENT_2))
         print(f"Windowed results written to {windowed_path}")
     except Exception as e:
         print(f"Error writing windowed results: {e}")
@@ -1,151 +1,362 @@
 #!/usr/bin/env python3
 import os
 import sys
-import json
 import re
 import shutil
 import csv
-from pydantic import BaseModel
-from ollama import chat
+import io
+import bisect
+import glob
+import hashlib
+import sqlite3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import orjson
+from ollama import AsyncClient
 
 # Default model name, can be overwritten from the command line.
 LLM_MODEL = "qwen2.5-coder"
 
-class BugLine(BaseModel):
-    line_no: int
+# Optional OpenAI-compatible server (vLLM, llama.cpp's llama-server, ...) with continuous
+# batching. When LLM_SERVER_URL is set, requests go there instead of to Ollama.
+LLM_SERVER_URL = os.environ.get("LLM_SERVER_URL")
 
-def ask_llm_for_bug_line(instruction: str, buggy_code: str) -> int:
+# Keep the model loaded between requests. The answer is a tiny JSON object, so cap its length.
+KEEP_ALIVE = "10m"
+MAX_ANSWER_TOKENS = 32
+
+# main() prints a progress line every PROGRESS_EVERY files; per-file details go to a log file.
+PROGRESS_EVERY = 50
+
+# JSON schema of the answer, {"line_no": int}. Written out by hand (it is what Pydantic
+# generates for a BugLine model with one int field), so no model is needed at runtime.
+BUG_LINE_SCHEMA = {
+    "properties": {"line_no": {"title": "Line No", "type": "integer"}},
+    "required": ["line_no"],
+    "title": "BugLine",
+    "type": "object",
+}
+
+# Code-position windows by line_no_percent: [0, 25), [25, 50), [50, 75) and [75, 100].
+WINDOW_BOUNDS = (25.0, 50.0, 75.0)
+WINDOW_KEYS = ("0-25", "25-50", "50-75", "75-100")
+
+# Set by --compact: send compact_code(buggy_code) to the LLM instead of the code as is.
+compact_prompts = False
+# A whole-line comment, or the trailing whitespace of any line.
+COMPACT_RE = re.compile(r"^[ \t]*#.*$|[ \t]+$", re.MULTILINE)
+
+def compact_code(src: str) -> str:
+    """
+    Shrinks the code sent to the LLM by emptying whole-line comments and stripping trailing
+    whitespace. Lines are emptied rather than removed, so line numbers are unchanged and the
+    prediction still refers to the original code.
+    """
+    return COMPACT_RE.sub("", src)
+
+async def ask_llm_for_bug_line(client, instruction: str, buggy_code: str) -> tuple:
     """
     Calls the LLM with a structured format to obtain the bug's exact line number.
-    Returns the predicted line number (int) or -1 if parsing fails.
+    client is an httpx.AsyncClient when LLM_SERVER_URL is set, otherwise an ollama AsyncClient.
+    Returns (predicted line number, None), or (-1, message) if parsing fails; the caller
+    logs the message with the file's other output.
     """
-    response = chat(
-        messages=[
-            {
-                'role': 'user',
-                'content': f'I want this code to "{instruction}" but I am experiencing unexpected output.\n'
-                           f'Buggy Code:\n{buggy_code}\n'
-                           f'Can you give me the exact line number where the bug is?',
-            }
-        ],
-        model=LLM_MODEL,
-        format=BugLine.model_json_schema()
-    )
+    messages = [
+        {
+            'role': 'user',
+            'content': f'I want this code to "{instruction}" but I am experiencing unexpected output.\n'
+                       f'Buggy Code:\n{buggy_code}\n'
+                       f'Can you give me the exact line number where the bug is?',
+        }
+    ]
+    if LLM_SERVER_URL:
+        response = await client.post(
+            f"{LLM_SERVER_URL.rstrip('/')}/v1/chat/completions",
+            json={
+                "model": LLM_MODEL,
+                "messages": messages,
+                "max_tokens": MAX_ANSWER_TOKENS,
+                "response_format": {"type": "json_schema", "json_schema": {"name": "BugLine", "schema": BUG_LINE_SCHEMA}},
+            },
+        )
+        response.raise_for_status()
+        content = orjson.loads(response.content)["choices"][0]["message"]["content"]
+    else:
+        response = await client.chat(
+            messages=messages,
+            model=LLM_MODEL,
+            format=BUG_LINE_SCHEMA,
+            options={"num_predict": MAX_ANSWER_TOKENS},
+            keep_alive=KEEP_ALIVE,
+            stream=False
+        )
+        content = response.message.content
 
+    # The answer is constrained to BUG_LINE_SCHEMA, so only the one field needs checking.
     try:
-        bug_line_obj = BugLine.model_validate_json(response.message.content)
-        return bug_line_obj.line_no
+        return int(orjson.loads(content)["line_no"]), None
     except Exception as e:
-        print("Failed to parse LLM response as JSON:", response.message.content)
-        return -1
-    
-def main():
-    global LLM_MODEL
+        return -1, f"Failed to parse LLM response as JSON: {content}"
+
+###############################################################################
+# Persistent prediction cache
+###############################################################################
+
+# Predictions are cached per model in CACHE_DIR/<model>.sqlite, keyed on the program, so
+# re-running the sweep (or a dataset that overlaps an earlier one) skips the LLM call.
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "test_llm_original")
+cache_db = None
+
+def model_file_name(model: str) -> str:
+    """
+    Makes a model name such as "hf.co/org/model:tag" usable as (part of) a file name.
+    """
+    return model.replace(os.sep, "_").replace(":", "_")
+
+def open_cache(model: str) -> sqlite3.Connection:
+    """
+    Opens (creating if needed) the prediction cache of the given model.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    db_name = model_file_name(model) + ".sqlite"
+    db = sqlite3.connect(os.path.join(CACHE_DIR, db_name), isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("CREATE TABLE IF NOT EXISTS cache (key BLOB PRIMARY KEY, pred INTEGER)")
+    return db
+
+async def ask_llm_cached(client, semaphore: asyncio.Semaphore, instruction: str, buggy_code: str) -> tuple:
+    """
+    Returns the cached prediction for this program if there is one; otherwise asks the LLM,
+    holding the semaphore only for the request, and caches the answer. Invalid answers (-1)
+    are not cached, so they are retried. Returns (prediction, message) like
+    ask_llm_for_bug_line.
+    """
+    if cache_db is None:
+        async with semaphore:
+            return await ask_llm_for_bug_line(client, instruction, buggy_code)
+    key = hashlib.blake2b(f"{LLM_MODEL}\0{instruction}\0{buggy_code}".encode("utf-8"), digest_size=16).digest()
+    row = cache_db.execute("SELECT pred FROM cache WHERE key = ?", (key,)).fetchone()
+    if row is not None:
+        return row[0], None
+    async with semaphore:
+        predicted_line_no, message = await ask_llm_for_bug_line(client, instruction, buggy_code)
+    if predicted_line_no != -1:
+        cache_db.execute("INSERT OR IGNORE INTO cache (key, pred) VALUES (?, ?)", (key, predicted_line_no))
+    return predicted_line_no, message
+
+def preflight(file_path: str) -> tuple:
+    """
+    Reads one buggy JSON file and checks its fields. Runs in a worker thread before any LLM
+    request is scheduled, so files that cannot be tested never reach the LLM pipeline.
+    Returns (job, None) where job is the (instruction, buggy_code, original_line_no, window)
+    arguments of process_file, or (None, outcome) with the "error" (unreadable file) or
+    "skip" (bad fields) outcome of the file, in process_file's format.
+    """
+    filename = os.path.basename(file_path)
+    try:
+        with open(file_path, "rb") as f:
+            data = orjson.loads(f.read())
+    except Exception as e:
+        return None, ("error", None, None, None, f"Error reading {filename}: {e}")
+
+    # Each JSON is expected to have "instruction", "buggy_code", "line_no", and "line_no_percent"
+    instruction = data.get("instruction", "").strip()
+    buggy_code = data.get("buggy_code", "").strip()
+    original_line_no = data.get("line_no")
+    line_no_percent = data.get("line_no_percent", "").strip()
+
+    if not instruction or not buggy_code or original_line_no is None or not line_no_percent:
+        return None, ("skip", None, None, None, f"Missing required fields in {filename}. Skipping.")
+
+    # Determine the window based on line_no_percent.
+    try:
+        # The field is "NN%" or "NN.NN%"; slicing off the sign avoids a strip() copy.
+        percent_value = float(line_no_percent[:-1] if line_no_percent.endswith('%') else line_no_percent)
+    except ValueError:
+        return None, ("skip", None, None, None, f"Invalid line_no_percent value in {filename}. Skipping.")
+
+    window = bisect.bisect_right(WINDOW_BOUNDS, percent_value)
+    if compact_prompts:
+        buggy_code = compact_code(buggy_code)
+    return (instruction, buggy_code, original_line_no, window), None
+
+async def process_file(client, semaphore: asyncio.Semaphore, instruction: str, buggy_code: str, original_line_no: int, window: int) -> tuple:
+    """
+    Asks the LLM (or the cache) for the bug line of one preflighted file. It only reports
+    the outcome; main() updates the counters.
+    Returns (verdict, window, original_line_no, predicted_line_no, message) where verdict is
+    "match", "mismatch" or "invalid" (no usable LLM answer), window is an index into
+    WINDOW_KEYS, and message explains an unparsable answer ("invalid"), else None.
+    """
+    # Ask LLM for the bug line using a new context.
+    predicted_line_no, message = await ask_llm_cached(client, semaphore, instruction, buggy_code)
+    if predicted_line_no == -1:
+        return "invalid", window, original_line_no, predicted_line_no, message
+
+    verdict = "match" if abs(predicted_line_no - original_line_no) <= 2 else "mismatch"
+    return verdict, window, original_line_no, predicted_line_no, None
+
+async def main():
+    # --no-cache always asks the LLM (e.g. for benchmarking) and leaves the cache untouched.
+    # --compact sends the code through compact_code() to cut the prompt length.
+    global LLM_MODEL, cache_db, compact_prompts
+    args = sys.argv[1:]
+    use_cache = "--no-cache" not in args
+    if not use_cache:
+        args.remove("--no-cache")
+    compact_prompts = "--compact" in args
+    if compact_prompts:
+        args.remove("--compact")
+
     # First argument: LLM model (optional)
-    LLM_MODEL = sys.argv[1] if len(sys.argv) > 1 else LLM_MODEL
+    LLM_MODEL = args[0] if len(args) > 0 else LLM_MODEL
     print(f"Using LLM model: {LLM_MODEL}")
 
     # Second argument: input folder containing buggy JSON files.
-    buggy_dataset_folder = sys.argv[2] if len(sys.argv) > 2 else None
+    buggy_dataset_folder = args[1] if len(args) > 1 else None
     if not buggy_dataset_folder:
         print("Input folder is required. Exiting.")
         sys.exit(1)
     
     # Optional third argument: output folder for matched files.
-    output_folder = sys.argv[3] if len(sys.argv) > 3 else None
+    output_folder = args[2] if len(args) > 2 else None
     if output_folder is not None and not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
     # Optional fourth argument: stop after this many successful matches (e.g. 10 for artifact).
     max_matched = None
-    if len(sys.argv) > 4:
+    if len(args) > 3:
         try:
-            max_matched = int(sys.argv[4])
+            max_matched = int(args[3])
         except ValueError:
             pass
     if max_matched is not None:
         print(f"Will stop after {max_matched} successful matches.")
+
+    if use_cache:
+        cache_db = open_cache(LLM_MODEL)
     
     success_count = 0 
     failure_count = 0 
     total_count = 0
 
-    # Initialize window counters for matches and mismatches.
-    match_counts = {"0-25": 0, "25-50": 0, "50-75": 0, "75-100": 0}
-    mismatch_counts = {"0-25": 0, "25-50": 0, "50-75": 0, "75-100": 0}
+    # Initialize window counters for matches and mismatches, indexed like WINDOW_KEYS.
+    match_counts = [0] * len(WINDOW_KEYS)
+    mismatch_counts = [0] * len(WINDOW_KEYS)
 
-    # Process every JSON file in the buggy_dataset folder.
-    for filename in os.listdir(buggy_dataset_folder):
-        if not filename.lower().endswith(".json"):
-            continue
-        file_path = os.path.join(buggy_dataset_folder, filename)
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception as e:
-            print(f"Error reading {filename}: {e}")
-            continue
-
-        # Each JSON is expected to have "instruction", "buggy_code", "line_no", and "line_no_percent"
-        instruction = data.get("instruction", "").strip()
-        buggy_code = data.get("buggy_code", "").strip()
-        original_line_no = data.get("line_no")
-        line_no_percent = data.get("line_no_percent", "").strip()
-        
-        if not instruction or not buggy_code or original_line_no is None or not line_no_percent:
-            print(f"Missing required fields in {filename}. Skipping.")
-            failure_count += 1
-            continue
-
-        # Determine the window based on line_no_percent.
+    # Process every JSON file in the buggy_dataset folder. The case-insensitive suffix match
+    # is done by glob's compiled pattern rather than by lowercasing each name.
+    file_paths = glob.glob(os.path.join(glob.escape(buggy_dataset_folder), "*.[jJ][sS][oO][nN]"))
+
+    # Read and check all files up front in a thread pool, so the disk reads overlap each
+    # other instead of running one by one inside the event loop, and only files that can
+    # be tested are scheduled.
+    with ThreadPoolExecutor() as executor:
+        checked = list(executor.map(preflight, file_paths))
+
+    # At most OLLAMA_NUM_PARALLEL (default 8) LLM requests are in flight; match this to the
+    # OLLAMA_NUM_PARALLEL setting of the Ollama server, which then decodes the in-flight
+    # requests together as one batch. A finished request frees its slot for the next file
+    # right away, so the batch stays full instead of waiting for the slowest prompt of a
+    # fixed group. Results are consumed in file order, so the counters, the output and the
+    # max_matched cut-off are the same as when the files are processed one by one. With
+    # LLM_SERVER_URL, raise OLLAMA_NUM_PARALLEL to the number of requests the server should
+    # batch (e.g. llama-server --parallel, or a few hundred for vLLM). Ollama reads 0 as
+    # "choose automatically", which would be a semaphore that never admits a request, so
+    # use at least 1.
+    max_parallel = max(1, int(os.environ.get("OLLAMA_NUM_PARALLEL", "8")))
+    # One client for all requests, so HTTP connections are kept alive and reused across files.
+    client = httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=max_parallel)) if LLM_SERVER_URL else AsyncClient()
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    # Tasks take request slots in the order they are created. Without a max_matched cut-off
+    # every file is sent anyway, so all tasks are created up front, shortest code first: the
+    # requests batched together then have similar lengths, and short prompts do not wait
+    # behind long ones. With a cut-off, tasks are created in file order and only
+    # max_parallel files ahead of the one being consumed, so at most max_parallel - 1
+    # requests are sent for files past the stopping point.
+    order = [i for i, (job, _) in enumerate(checked) if job is not None]
+    if max_matched is None:
+        order.sort(key=lambda i: len(checked[i][0][1]))
+        lookahead = len(order)
+    else:
+        lookahead = max_parallel
+    tasks = [None] * len(file_paths)
+    scheduled = 0
+
+    def schedule_up_to(count: int) -> None:
+        """Creates the tasks of the first count files of order that have none yet."""
+        nonlocal scheduled
+        while scheduled < min(count, len(order)):
+            i = order[scheduled]
+            tasks[i] = asyncio.create_task(process_file(client, semaphore, *checked[i][0]))
+            scheduled += 1
+
+    # Per-file results go to a log file; the console only gets a progress line every
+    # PROGRESS_EVERY files, so printing does not hold up runs with fast or cached answers.
+    log_path = f"results_original_{model_file_name(LLM_MODEL)}_{os.path.basename(os.path.normpath(buggy_dataset_folder))}.log"
+    with open(log_path, "w", encoding="utf-8") as log:
         try:
-            percent_value = float(line_no_percent.strip('%'))
-        except ValueError:
-            print(f"Invalid line_no_percent value in {filename}. Skipping.")
-            failure_count += 1
-            continue
-
-        if percent_value < 25:
-            window = "0-25"
-        elif percent_value < 50:
-            window = "25-50"
-        elif percent_value < 75:
-            window = "50-75"
-        else:
-            window = "75-100"
-
-        print(f"\nProcessing {filename}:")
-        print(f"  Original line number: {original_line_no}")
-        sys.stdout.flush()
-
-        # Ask LLM for the bug line using a new context.
-        predicted_line_no = ask_llm_for_bug_line(instruction, buggy_code)
-        if predicted_line_no == -1:
-            print("  LLM did not return a valid line number. Skipping file.")
-            failure_count += 1
-            continue
-
-        if abs(predicted_line_no - original_line_no) <= 2:
-            print(f"  LLM predicted line number: {original_line_no}")
-            print("  Verdict: MATCH")
-            success_count += 1
-            match_counts[window] += 1
-            if output_folder is not None:
-                shutil.copy(file_path, os.path.join(output_folder, filename))
-            if max_matched is not None and success_count >= max_matched:
-                print(f"\nReached {max_matched} successful matches. Stopping.")
-                sys.stdout.flush()
-                break
-        else:
-            print(f"  LLM predicted line number: {predicted_line_no}")
-            print("  Verdict: MISMATCH")
-            failure_count += 1
-            mismatch_counts[window] += 1
-
-        total_count += 1
-        print(f"  Total Count: {total_count}")
-        print(f"  Success count (match): {success_count}")
-        print(f"  Failure count (mismatch or error): {failure_count}")
+            consumed = 0
+            for i, file_path in enumerate(file_paths):
+                if i and i % PROGRESS_EVERY == 0:
+                    print(f"  {i}/{len(file_paths)} files: {success_count} matches, {failure_count} failures")
+                filename = os.path.basename(file_path)
+                # Rejected files already have their outcome from the preflight.
+                if checked[i][0] is None:
+                    outcome = checked[i][1]
+                else:
+                    schedule_up_to(consumed + lookahead)
+                    consumed += 1
+                    outcome = await tasks[i]
+                verdict, window, original_line_no, predicted_line_no, message = outcome
+                if verdict == "error":
+                    print(message, file=log)
+                    continue
+                if verdict == "skip":
+                    print(message, file=log)
+                    failure_count += 1
+                    continue
+
+                print(f"\nProcessing {filename}:", file=log)
+                print(f"  Original line number: {original_line_no}", file=log)
+
+                if verdict == "invalid":
+                    if message is not None:
+                        print(f"  {message}", file=log)
+                    print("  LLM did not return a valid line number. Skipping file.", file=log)
+                    failure_count += 1
+                    continue
+
+                if verdict == "match":
+                    print(f"  LLM predicted line number: {original_line_no}", file=log)
+                    print("  Verdict: MATCH", file=log)
+                    success_count += 1
+                    match_counts[window] += 1
+                    if output_folder is not None:
+                        shutil.copy(file_path, os.path.join(output_folder, filename))
+                    if max_matched is not None and success_count >= max_matched:
+                        print(f"\nReached {max_matched} successful matches. Stopping.")
+                        break
+                else:
+                    print(f"  LLM predicted line number: {predicted_line_no}", file=log)
+                    print("  Verdict: MISMATCH", file=log)
+                    failure_count += 1
+                    mismatch_counts[window] += 1
+
+                total_count += 1
+                print(f"  Total Count: {total_count}", file=log)
+                print(f"  Success count (match): {success_count}", file=log)
+                print(f"  Failure count (mismatch or error): {failure_count}", file=log)
+        finally:
+            # Requests for files past the stopping point are no longer needed.
+            pending = [task for task in tasks if task is not None]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+    print(f"\nPer-file results written to {log_path}")
 
     print("\nSummary:")
     print(f"  Tested Folder: {buggy_dataset_folder}")
@@ -154,8 +365,8 @@ def main():
     print(f"  Failure count (mismatch or error): {failure_count}")
 
     print("\nWindowed Results:")
-    for win in ["0-25", "25-50", "50-75", "75-100"]:
-        print(f"  Window {win}%: Matches = {match_counts[win]}, Mismatches = {mismatch_counts[win]}")
+    for win, matches, mismatches in zip(WINDOW_KEYS, match_counts, mismatch_counts):
+        print(f"  Window {win}%: Matches = {matches}, Mismatches = {mismatches}")
 
     # Compute overall accuracy.
     accuracy_percent = round((success_count / total_count) * 100, 2) if total_count > 0 else 0
@@ -198,27 +409,27 @@ def main():
         LLM_MODEL,
         bug_type,
         language,
-        match_counts["0-25"],
-        match_counts["25-50"],
-        match_counts["50-75"],
-        match_counts["75-100"],
-        mismatch_counts["0-25"],
-        mismatch_counts["25-50"],
-        mismatch_counts["50-75"],
-        mismatch_counts["75-100"]
+        *match_counts,
+        *mismatch_counts
     ]
 
     # Write header and row to results.csv.
     try:
-        file_exists = os.path.exists(csv_file)
-        with open(csv_file, "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            if not file_exists:
+        # Append with a single O_APPEND write, so concurrent test_llm_original runs cannot
+        # interleave their rows; the header is only written into an empty (new) file.
+        fd = os.open(csv_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            if os.fstat(fd).st_size == 0:
                 writer.writerow(header)
             writer.writerow(row)
+            os.write(fd, buf.getvalue().encode("utf-8"))
+        finally:
+            os.close(fd)
         print(f"\nResults written to {csv_file}")
     except Exception as e:
         print(f"Error writing to {csv_file}: {e}")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())